@@ -0,0 +1,423 @@
+"""Async read path for the hot GET endpoints.
+
+The views mirror the responses, validators and response cache of the
+DRF viewsets but use the async ORM, so a slow query does not hold an
+ASGI worker. Anything they do not cover (writes, cursor pagination)
+is handed to the sync viewset.
+
+Queries are awaited one after another: Django runs async ORM calls in
+a single thread on one connection, so gathering them would not make
+them concurrent. Cache lookups go through the async cache API so a
+network round trip to Redis does not block the event loop.
+"""
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from foodgram_backend.db_router import (
+    acan_read_from_replica,
+    read_primary_if_recent,
+    replica_reads,
+)
+from foodgram_backend.metrics import cache_lookup
+from profiles.models import Follow, User
+from profiles.serializers import UserSerializer
+from recipes.autocomplete import VERSION_KEY as PRODUCT_VERSION_KEY
+from recipes.autocomplete import product_index
+from recipes.models import Basket, Bookmark, Product
+from recipes.serializers import DishReadSerializer, ProductSerializer
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    NotFound,
+    ValidationError,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import short_links
+from .authentication import acached_snapshot, check_snapshot, load_snapshot
+from .cache import (
+    LIST_VERSION_KEY,
+    SHARED_VERSION_KEY,
+    aget_versions,
+    dish_version_key,
+    make_etag,
+    response_cache_key,
+    response_cache_stats,
+    set_etag,
+    version_keys,
+)
+from .filters import DishFilter, ProductFilter
+from .paginations import CustomPagination, KeysetPagination, estimate_count
+from .views import DishViewSet, IngredientViewSet, UserViewSet
+
+DISH_FILTERS = ('creator', 'bookmarked', 'in_basket', 'search', 'have')
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+    )
+
+
+def error_response(exc):
+    data = exc.detail
+    if not isinstance(data, (dict, list)):
+        data = {'detail': data}
+    response = json_response(data, exc.status_code)
+    if isinstance(exc, AuthenticationFailed):
+        response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+async def authenticate(request):
+    """Cached token authentication, as in the viewsets."""
+    parts = request.headers.get('Authorization', '').split()
+    if not parts or parts[0].lower() != 'token':
+        return AnonymousUser()
+    if len(parts) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+    snapshot = await acached_snapshot(parts[1])
+    if snapshot is None:
+        snapshot = await sync_to_async(load_snapshot)(parts[1])
+    return check_snapshot(snapshot)
+
+
+async def values_set(queryset, field):
+    return {
+        value async for value in queryset.values_list(field, flat=True)
+    }
+
+
+async def fetch(queryset):
+    return [obj async for obj in queryset]
+
+
+def page_size(request):
+    try:
+        size = int(request.GET[CustomPagination.page_size_query_param])
+        if size > 0:
+            return size
+    except (KeyError, ValueError):
+        pass
+    return CustomPagination.page_size
+
+
+async def paginate(request, queryset):
+    """Page-number pagination matching CustomPagination.
+
+    Returns the page rows and a callable building the response body.
+    """
+    size = page_size(request)
+    count_mode = request.GET.get(CustomPagination.count_query_param)
+    if count_mode not in CustomPagination.count_modes[1:]:
+        count_mode = 'exact'
+    try:
+        number = int(request.GET.get('page') or 1)
+        if number < 1:
+            raise ValueError
+    except ValueError:
+        raise NotFound(CustomPagination.invalid_page_message)
+    offset = (number - 1) * size
+
+    if count_mode == 'exact':
+        rows = await fetch(queryset[offset:offset + size])
+        count = await queryset.acount()
+        pages = max(ceil(count / size), 1)
+        if number > pages:
+            raise NotFound(CustomPagination.invalid_page_message)
+        has_next = number < pages
+    else:
+        rows = await fetch(queryset[offset:offset + size + 1])
+        count = None
+        if count_mode == 'estimate':
+            count = await sync_to_async(estimate_count)(queryset)
+        has_next = len(rows) > size
+        rows = rows[:size]
+
+    def body(data):
+        url = request.build_absolute_uri()
+        previous_link = None
+        if number == 2:
+            previous_link = remove_query_param(url, 'page')
+        elif number > 2:
+            previous_link = replace_query_param(url, 'page', number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, 'page', number + 1)
+            if has_next else None,
+            'previous': previous_link,
+            'results': data,
+        }
+    return rows, body
+
+
+def sync_fallback(viewset, actions):
+    return sync_to_async(viewset.as_view(actions))
+
+
+def read_view(viewset, actions, version_keys_of, cache_responses=False):
+    """Serve GET with the decorated coroutine, other methods with DRF.
+
+    The coroutine returns response data; conditional GET, the anonymous
+    response cache and DRF-style errors are handled here.
+    """
+    fallback = sync_fallback(viewset, actions)
+
+    def decorator(build):
+        @csrf_exempt
+        @wraps(build)
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await fallback(request, *args, **kwargs)
+            try:
+                request.user = await authenticate(request)
+            except APIException as exc:
+                return error_response(exc)
+            user = request.user
+            token = replica_reads.set(
+                await acan_read_from_replica('GET', user)
+            )
+            try:
+                return await versioned(request, user, *args, **kwargs)
+            finally:
+                replica_reads.reset(token)
+
+        async def versioned(request, user, *args, **kwargs):
+            keys = version_keys(version_keys_of(*args, **kwargs), user)
+            versions = await aget_versions(keys)
+            read_primary_if_recent(versions)
+            etag = make_etag(request, user, versions)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                use_cache = (
+                    cache_responses
+                    and settings.RESPONSE_CACHE
+                    and not user.is_authenticated
+                )
+                response = await (
+                    cached_response(etag, build, request, *args, **kwargs)
+                    if use_cache
+                    else build_response(build, request, *args, **kwargs)
+                )
+            return set_etag(response, etag)
+
+        return view
+    return decorator
+
+
+async def build_response(build, request, *args, **kwargs):
+    try:
+        data = await build(request, *args, **kwargs)
+    except APIException as exc:
+        return error_response(exc)
+    if isinstance(data, HttpResponse):
+        return data
+    return json_response(data)
+
+
+async def cached_response(etag, build, request, *args, **kwargs):
+    response_cache = caches[settings.RESPONSE_CACHE_ALIAS]
+    key = response_cache_key(etag)
+    data = await response_cache.aget(key)
+    if data is not None:
+        response_cache_stats['hits'] += 1
+        cache_lookup('response', True)
+        response = json_response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+    response_cache_stats['misses'] += 1
+    cache_lookup('response', False)
+    try:
+        data = await build(request, *args, **kwargs)
+    except APIException as exc:
+        return error_response(exc)
+    if isinstance(data, HttpResponse):
+        return data
+    await response_cache.aset(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+    response = json_response(data)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+async def dish_flags(user, dish_ids, creator_ids):
+    if not user.is_authenticated:
+        return {
+            'subscribed_ids': set(),
+            'bookmarked_ids': set(),
+            'basket_ids': set(),
+        }
+    return {
+        'subscribed_ids': await values_set(
+            Follow.objects.filter(user=user, following_id__in=creator_ids)
+            .order_by(),
+            'following_id',
+        ),
+        'bookmarked_ids': await values_set(
+            Bookmark.objects.filter(user=user, dish_id__in=dish_ids),
+            'dish_id',
+        ),
+        'basket_ids': await values_set(
+            Basket.objects.filter(user=user, dish_id__in=dish_ids),
+            'dish_id',
+        ),
+    }
+
+
+sync_dish_list = sync_fallback(DishViewSet, {'get': 'list'})
+
+
+@read_view(
+    DishViewSet,
+    {'get': 'list', 'post': 'create'},
+    lambda: [LIST_VERSION_KEY],
+    cache_responses=True,
+)
+async def dish_list(request):
+    if (
+        request.GET.get('pagination') == 'cursor'
+        or KeysetPagination.cursor_query_param in request.GET
+    ):
+        return await sync_dish_list(request)
+    queryset = DishViewSet.queryset.all()
+    if any(name in request.GET for name in DISH_FILTERS):
+        filterset = DishFilter(
+            request.GET, queryset=queryset, request=request
+        )
+        if not await sync_to_async(filterset.is_valid)():
+            raise ValidationError(filterset.errors)
+        # The `have` filter may load the match index from the database.
+        queryset = await sync_to_async(lambda: filterset.qs)()
+    dishes, body = await paginate(request, queryset)
+    context = await dish_flags(
+        request.user,
+        {dish.id for dish in dishes},
+        {dish.creator_id for dish in dishes},
+    )
+    return body(DishReadSerializer(
+        dishes, many=True, context={'request': request, **context}
+    ).data)
+
+
+def dish_detail_keys(pk):
+    return [SHARED_VERSION_KEY, dish_version_key(pk)]
+
+
+@read_view(
+    DishViewSet,
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    dish_detail_keys,
+    cache_responses=True,
+)
+async def dish_detail(request, pk):
+    dish = await DishViewSet.queryset.filter(pk=pk).afirst()
+    if dish is None:
+        raise NotFound('No Dish matches the given query.')
+    context = await dish_flags(request.user, {pk}, {dish.creator_id})
+    return DishReadSerializer(
+        dish, context={'request': request, **context}
+    ).data
+
+
+@read_view(
+    UserViewSet,
+    {'get': 'list', 'post': 'create'},
+    lambda: [SHARED_VERSION_KEY],
+)
+async def user_list(request):
+    if (
+        request.GET.get('pagination') == 'cursor'
+        or KeysetPagination.cursor_query_param in request.GET
+    ):
+        return await sync_fallback(UserViewSet, {'get': 'list'})(request)
+    users, body = await paginate(request, UserViewSet.queryset.all())
+    subscribed = set()
+    if request.user.is_authenticated:
+        subscribed = await values_set(
+            Follow.objects.filter(
+                user=request.user,
+                following_id__in=[user.id for user in users],
+            ).order_by(),
+            'following_id',
+        )
+    return body(UserSerializer(users, many=True, context={
+        'request': request, 'subscribed_ids': subscribed,
+    }).data)
+
+
+@read_view(
+    UserViewSet,
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    lambda pk: [SHARED_VERSION_KEY],
+)
+async def user_detail(request, pk):
+    user = await User.objects.filter(pk=pk).afirst()
+    if user is None:
+        raise NotFound('No User matches the given query.')
+    subscribed = set()
+    if request.user.is_authenticated:
+        subscribed = await values_set(
+            Follow.objects.filter(
+                user=request.user, following_id=pk
+            ).order_by(),
+            'following_id',
+        )
+    return UserSerializer(user, context={
+        'request': request, 'subscribed_ids': subscribed,
+    }).data
+
+
+@read_view(
+    IngredientViewSet,
+    {'get': 'list'},
+    lambda: [PRODUCT_VERSION_KEY],
+)
+async def ingredient_list(request):
+    name = request.GET.get('name')
+    queryset = Product.objects.all()
+    if not name:
+        products = await fetch(queryset)
+    elif settings.INGREDIENT_INDEX_IN_MEMORY:
+        products = await sync_to_async(product_index.search)(
+            name, settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        )
+    else:
+        queryset = ProductFilter({'name': name}, queryset=queryset).qs
+        products = await fetch(
+            queryset[:settings.INGREDIENT_AUTOCOMPLETE_LIMIT]
+        )
+    return ProductSerializer(products, many=True).data
+
+
+async def short_link_redirect(request, short_id):
+    try:
+        dish_id = short_links.decode(short_id)
+    except ValueError:
+        return HttpResponseRedirect('/404')
+    dish_ids = short_links.dish_ids
+    exists = (
+        not dish_ids.is_stale() and dish_ids.in_bitmap(dish_id)
+        or await sync_to_async(dish_ids.exists)(dish_id)
+    )
+    if not exists:
+        return HttpResponseRedirect('/404')
+    return HttpResponseRedirect(f'/recipes/{dish_id}/')
@@ -0,0 +1,187 @@
+import time
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from foodgram_backend.metrics import cache_lookup
+from profiles.models import User
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+# Loaded fields of a cached user, in model order as `from_db` expects.
+# The rest are deferred, so `save()` on a cached user never writes back
+# stale counters or the password.
+SNAPSHOT_FIELDS = (
+    'id', 'is_superuser', 'username', 'is_staff', 'is_active',
+    'email', 'first_name', 'last_name', 'avatar', 'avatar_variants',
+)
+
+
+# Stored in place of a revoked token's snapshot for AUTH_TOKEN_REVOKED_TTL
+# seconds, so a request that read the token before the revocation
+# committed cannot cache its stale snapshot again.
+REVOKED = 'revoked'
+
+
+def token_key(key):
+    return f'auth_token:{key}'
+
+
+class TokenUserCache:
+    """Per-worker TTL/LRU of token keys to user snapshots.
+
+    Entries live AUTH_TOKEN_LOCAL_TTL seconds, so a token revoked through
+    another worker stops working here within that time.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            snapshot, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return snapshot
+
+    def set(self, key, snapshot):
+        if not settings.AUTH_TOKEN_LOCAL_TTL:
+            return
+        with self.lock:
+            self.entries[key] = (
+                snapshot, time.monotonic() + settings.AUTH_TOKEN_LOCAL_TTL
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_LRU_SIZE:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_tokens = TokenUserCache()
+
+
+def user_from(snapshot):
+    return User.from_db(router.db_for_read(User), SNAPSHOT_FIELDS, snapshot)
+
+
+def cached_snapshot(key):
+    """Return the snapshot of a token's user without touching the DB.
+
+    The shared layer is only used when every worker sees the same cache:
+    in a per-process cache a revocation would never reach other workers.
+    """
+    snapshot = local_tokens.get(key)
+    if snapshot is None and settings.SHARED_CACHE:
+        snapshot = cache.get(token_key(key))
+        if snapshot == REVOKED:
+            snapshot = None
+        elif snapshot is not None:
+            local_tokens.set(key, snapshot)
+    cache_lookup('auth_token', snapshot is not None)
+    return snapshot
+
+
+async def acached_snapshot(key):
+    snapshot = local_tokens.get(key)
+    if snapshot is None and settings.SHARED_CACHE:
+        snapshot = await cache.aget(token_key(key))
+        if snapshot == REVOKED:
+            snapshot = None
+        elif snapshot is not None:
+            local_tokens.set(key, snapshot)
+    cache_lookup('auth_token', snapshot is not None)
+    return snapshot
+
+
+def load_snapshot(key):
+    """Read the token's user from the database and cache the snapshot.
+
+    `add` leaves a revocation tombstone in place: the rows may have been
+    read before that revocation committed. Such a snapshot is returned
+    but cached nowhere.
+    """
+    values = User.objects.filter(auth_token__key=key).values_list(
+        *SNAPSHOT_FIELDS
+    ).first()
+    if values is None:
+        return None
+    if settings.SHARED_CACHE and not cache.add(
+        token_key(key), values, settings.AUTH_TOKEN_CACHE_TTL
+    ):
+        return values
+    local_tokens.set(key, values)
+    return values
+
+
+def forget_tokens(keys):
+    """Drop cached snapshots right away, without a tombstone."""
+    cache.delete_many([token_key(key) for key in keys])
+    for key in keys:
+        local_tokens.discard(key)
+
+
+def mark_revoked(keys):
+    cache.set_many(
+        {token_key(key): REVOKED for key in keys},
+        settings.AUTH_TOKEN_REVOKED_TTL,
+    )
+    for key in keys:
+        local_tokens.discard(key)
+
+
+def revoke_tokens(keys):
+    """Replace the snapshots of `keys` with tombstones once committed.
+
+    Before the commit other requests still read the old token and user
+    rows from the database, so an earlier revocation would be undone.
+    """
+    transaction.on_commit(partial(mark_revoked, list(keys)))
+
+
+def revoke_user_tokens(user_id):
+    revoke_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    )
+
+
+def check_snapshot(snapshot):
+    if snapshot is None:
+        raise AuthenticationFailed('Invalid token.')
+    user = user_from(snapshot)
+    if not user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token/user query when cached.
+
+    Lookups go through the worker's LRU, then the shared cache (only with
+    SHARED_CACHE), then the database. Entries are replaced with
+    tombstones when the token is deleted (logout) and when its user is
+    saved (password change, deactivation, profile edits), once that
+    commits; other workers' LRUs still serve a revoked token for up to
+    AUTH_TOKEN_LOCAL_TTL seconds.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = cached_snapshot(key) or load_snapshot(key)
+        user = check_snapshot(snapshot)
+        return user, Token(key=key, user=user)
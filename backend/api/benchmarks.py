@@ -0,0 +1,479 @@
+"""Endpoint benchmarks with per-endpoint budgets.
+
+Each scenario drives one API endpoint through the test client and
+records its SQL query count, p50/p95 latency and peak memory allocated
+while handling the request. `check` compares the results with the
+budgets committed in benchmark_budgets.json, keyed by database vendor,
+so the same suite runs on SQLite and, optionally, on PostgreSQL.
+"""
+import base64
+import json
+import statistics
+import time
+import tracemalloc
+from io import BytesIO, StringIO
+from math import ceil
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from PIL import Image
+from profiles.models import Follow, User
+from recipes.matching import reset as reset_match_index
+from recipes.models import Basket, Bookmark, Dish, Product
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import short_links
+from .authentication import local_tokens
+from .cache import bump_shared, bump_user
+
+BUDGETS_PATH = Path(__file__).with_name('benchmark_budgets.json')
+
+SIZES = {
+    'small': {'users': 30, 'dishes': 200},
+    'medium': {'users': 300, 'dishes': 3000},
+    'large': {'users': 2000, 'dishes': 30000},
+}
+CATALOG_SIZE = 300
+RECIPE_COMPONENTS = 10
+# Headroom of budgets written by --update-budgets over the measurement.
+LATENCY_HEADROOM = 3
+ALLOCATION_HEADROOM = 2
+
+
+def picture():
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), 'orange').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class Fixture:
+    """Objects the scenarios act on, created after the data is seeded."""
+
+    def __init__(self):
+        self.user = User.objects.create_user(
+            email='bench@example.com',
+            username='bench',
+            first_name='bench',
+            last_name='bench',
+            password='password',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.anonymous = APIClient()
+
+        self.products = list(
+            Product.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.picture = picture()
+        self.author = User.objects.exclude(id=self.user.id).order_by(
+            '-recipe_count', 'id'
+        ).first()
+        dishes = list(Dish.objects.order_by('-bookmark_count', 'id')[:21])
+        self.dish = dishes[0]
+        Bookmark.objects.bulk_create([
+            Bookmark(user=self.user, dish=dish) for dish in dishes[1:]
+        ])
+        Basket.objects.bulk_create([
+            Basket(user=self.user, dish=dish) for dish in dishes[1:]
+        ])
+        self.bulk_dish_ids = [dish.id for dish in dishes[1:11]]
+        self.followed_ids = list(
+            User.objects.exclude(
+                id__in=[self.user.id, self.author.id]
+            ).order_by('-recipe_count', 'id').values_list('id', flat=True)[:10]
+        )
+        Follow.objects.bulk_create([
+            Follow(user=self.user, following_id=author_id)
+            for author_id in self.followed_ids
+        ])
+        response = self.client.post(
+            '/api/recipes/', self.recipe('bench'), format='json'
+        )
+        self.own_dish_id = response.json()['id']
+
+    def changes(self, title):
+        return {
+            'title': title,
+            'description': 'описание',
+            'duration': 10,
+            'ingredients': [
+                {'id': product, 'quantity': 10 + number}
+                for number, product in enumerate(
+                    self.products[:RECIPE_COMPONENTS]
+                )
+            ],
+        }
+
+    def recipe(self, title):
+        return {**self.changes(title), 'picture': self.picture}
+
+
+class Scenario:
+
+    def __init__(self, name, method, path, data=None, setup=None,
+                 anonymous=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.setup = setup
+        self.anonymous = anonymous
+
+    def request(self, fixture):
+        client = fixture.anonymous if self.anonymous else fixture.client
+        data = self.data(fixture) if callable(self.data) else self.data
+        if self.method == 'get':
+            response = client.get(self.path(fixture), data)
+        else:
+            response = getattr(client, self.method)(
+                self.path(fixture), data, format='json'
+            )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+def relation_toggle(model, present):
+    def setup(fixture):
+        relation = model.objects.filter(user=fixture.user, dish=fixture.dish)
+        if present and not relation.exists():
+            model.objects.create(user=fixture.user, dish=fixture.dish)
+        elif not present:
+            relation.delete()
+    return setup
+
+
+def relations_toggle(model, field, ids, present):
+    def setup(fixture):
+        pks = ids(fixture)
+        model.objects.filter(
+            user=fixture.user, **{f'{field}__in': pks}
+        ).delete()
+        if present:
+            for pk in pks:
+                model.objects.create(user=fixture.user, **{f'{field}_id': pk})
+    return setup
+
+
+def spare_dish(fixture):
+    response = fixture.client.post(
+        '/api/recipes/', fixture.recipe('удаляемый рецепт'), format='json'
+    )
+    fixture.spare_dish_id = response.json()['id']
+
+
+def avatar_present(fixture):
+    fixture.client.put(
+        '/api/users/me/avatar/', {'avatar': fixture.picture}, format='json'
+    )
+
+
+def follow_toggle(present):
+    def setup(fixture):
+        relation = Follow.objects.filter(
+            user=fixture.user, following=fixture.author
+        )
+        if present and not relation.exists():
+            Follow.objects.create(user=fixture.user, following=fixture.author)
+        elif not present:
+            relation.delete()
+    return setup
+
+
+SCENARIOS = [
+    Scenario(
+        'recipes.list', 'get', lambda f: '/api/recipes/', anonymous=True
+    ),
+    Scenario('recipes.list.auth', 'get', lambda f: '/api/recipes/'),
+    Scenario(
+        'recipes.detail', 'get', lambda f: f'/api/recipes/{f.dish.id}/'
+    ),
+    Scenario(
+        'recipes.create', 'post', lambda f: '/api/recipes/',
+        data=lambda f: f.recipe('новый рецепт'),
+    ),
+    Scenario(
+        'recipes.update', 'patch',
+        lambda f: f'/api/recipes/{f.own_dish_id}/',
+        data=lambda f: f.changes('изменённый рецепт'),
+    ),
+    Scenario(
+        'recipes.favorite.add', 'post',
+        lambda f: f'/api/recipes/{f.dish.id}/favorite/',
+        setup=relation_toggle(Bookmark, present=False),
+    ),
+    Scenario(
+        'recipes.favorite.remove', 'delete',
+        lambda f: f'/api/recipes/{f.dish.id}/favorite/',
+        setup=relation_toggle(Bookmark, present=True),
+    ),
+    Scenario(
+        'recipes.shopping_cart.add', 'post',
+        lambda f: f'/api/recipes/{f.dish.id}/shopping_cart/',
+        setup=relation_toggle(Basket, present=False),
+    ),
+    Scenario(
+        'recipes.shopping_cart.remove', 'delete',
+        lambda f: f'/api/recipes/{f.dish.id}/shopping_cart/',
+        setup=relation_toggle(Basket, present=True),
+    ),
+    Scenario(
+        'recipes.delete', 'delete',
+        lambda f: f'/api/recipes/{f.spare_dish_id}/',
+        setup=spare_dish,
+    ),
+    Scenario(
+        'recipes.favorite.bulk.add', 'post',
+        lambda f: '/api/recipes/favorite/bulk/',
+        data=lambda f: {'ids': f.bulk_dish_ids},
+        setup=relations_toggle(
+            Bookmark, 'dish', lambda f: f.bulk_dish_ids, present=False
+        ),
+    ),
+    Scenario(
+        'recipes.favorite.bulk.remove', 'delete',
+        lambda f: '/api/recipes/favorite/bulk/',
+        data=lambda f: {'ids': f.bulk_dish_ids},
+        setup=relations_toggle(
+            Bookmark, 'dish', lambda f: f.bulk_dish_ids, present=True
+        ),
+    ),
+    Scenario(
+        'recipes.shopping_cart.bulk.add', 'post',
+        lambda f: '/api/recipes/shopping_cart/bulk/',
+        data=lambda f: {'ids': f.bulk_dish_ids},
+        setup=relations_toggle(
+            Basket, 'dish', lambda f: f.bulk_dish_ids, present=False
+        ),
+    ),
+    Scenario(
+        'recipes.shopping_cart.bulk.remove', 'delete',
+        lambda f: '/api/recipes/shopping_cart/bulk/',
+        data=lambda f: {'ids': f.bulk_dish_ids},
+        setup=relations_toggle(
+            Basket, 'dish', lambda f: f.bulk_dish_ids, present=True
+        ),
+    ),
+    Scenario(
+        'recipes.get_link', 'get',
+        lambda f: f'/api/recipes/{f.dish.id}/get-link/',
+    ),
+    Scenario(
+        'recipes.short_link', 'get',
+        lambda f: reverse(
+            'api:short-link',
+            kwargs={'short_id': short_links.encode(f.dish.id)},
+        ),
+        anonymous=True,
+    ),
+    Scenario(
+        'recipes.export_shopping_list', 'get',
+        lambda f: '/api/recipes/export_shopping_list/',
+        data={'format': 'txt'},
+    ),
+    Scenario('users.list', 'get', lambda f: '/api/users/', anonymous=True),
+    Scenario(
+        'users.detail', 'get', lambda f: f'/api/users/{f.author.id}/'
+    ),
+    Scenario('users.me', 'get', lambda f: '/api/users/me/'),
+    Scenario(
+        'users.subscriptions', 'get', lambda f: '/api/users/subscriptions/',
+        data={'recipes_limit': 3},
+    ),
+    Scenario(
+        'users.subscribe', 'post',
+        lambda f: f'/api/users/{f.author.id}/subscribe/?recipes_limit=3',
+        setup=follow_toggle(present=False),
+    ),
+    Scenario(
+        'users.unsubscribe', 'delete',
+        lambda f: f'/api/users/{f.author.id}/subscribe/',
+        setup=follow_toggle(present=True),
+    ),
+    Scenario(
+        'users.subscribe.bulk.add', 'post',
+        lambda f: '/api/users/subscribe/bulk/',
+        data=lambda f: {'ids': f.followed_ids},
+        setup=relations_toggle(
+            Follow, 'following', lambda f: f.followed_ids, present=False
+        ),
+    ),
+    Scenario(
+        'users.subscribe.bulk.remove', 'delete',
+        lambda f: '/api/users/subscribe/bulk/',
+        data=lambda f: {'ids': f.followed_ids},
+        setup=relations_toggle(
+            Follow, 'following', lambda f: f.followed_ids, present=True
+        ),
+    ),
+    Scenario(
+        'users.avatar.put', 'put',
+        lambda f: '/api/users/me/avatar/',
+        data=lambda f: {'avatar': f.picture},
+    ),
+    Scenario(
+        'users.avatar.delete', 'delete',
+        lambda f: '/api/users/me/avatar/',
+        setup=avatar_present,
+    ),
+    Scenario(
+        'users.set_password', 'post',
+        lambda f: '/api/users/set_password/',
+        data={'current_password': 'password', 'new_password': 'password'},
+    ),
+    Scenario(
+        'ingredients.search', 'get',
+        lambda f: '/api/ingredients/',
+        data={'name': 'продукт 1'},
+        anonymous=True,
+    ),
+]
+
+
+def seed(users, dishes, seed=1):
+    """Fill the database with a product catalog and skewed load data."""
+    Product.objects.bulk_create([
+        Product(title=f'продукт {number}', unit='г')
+        for number in range(CATALOG_SIZE)
+    ], ignore_conflicts=True)
+    call_command(
+        'generate_load_data',
+        users=users,
+        dishes=dishes,
+        seed=seed,
+        stdout=StringIO(),
+    )
+    reset_caches()
+    return Fixture()
+
+
+def reset_caches():
+    cache.clear()
+    local_tokens.clear()
+    reset_match_index()
+
+
+def invalidate_responses(fixture):
+    bump_shared()
+    bump_user(fixture.user.id)
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(scenario, fixture, repeats):
+    """Return the query count, p50/p95 in ms and peak allocation in KiB.
+
+    Dish and user versions are bumped before every request, so reads
+    miss the response cache and are measured on the uncached path.
+    """
+    latencies, queries = [], 0
+    for _ in range(repeats):
+        if scenario.setup:
+            scenario.setup(fixture)
+        invalidate_responses(fixture)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = scenario.request(fixture)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise AssertionError(
+                f'{scenario.name}: {response.status_code} '
+                f'{getattr(response, "content", b"")[:200]!r}'
+            )
+        queries = max(queries, counter.count)
+
+    if scenario.setup:
+        scenario.setup(fixture)
+    invalidate_responses(fixture)
+    tracemalloc.start()
+    try:
+        scenario.request(fixture)
+        allocated = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=20, method='inclusive')
+        p50, p95 = statistics.median(latencies), cuts[18]
+    else:
+        p50 = p95 = latencies[0]
+    return {
+        'queries': queries,
+        'p50_ms': round(p50 * 1000, 2),
+        'p95_ms': round(p95 * 1000, 2),
+        'alloc_kb': round(allocated / 1024, 1),
+    }
+
+
+def run(fixture, repeats, scenarios=SCENARIOS):
+    return {
+        scenario.name: measure(scenario, fixture, repeats)
+        for scenario in scenarios
+    }
+
+
+def load_budgets(profile):
+    if not BUDGETS_PATH.exists():
+        return None
+    return json.loads(BUDGETS_PATH.read_text(encoding='utf-8')).get(profile)
+
+
+def save_budgets(profile, results):
+    """Write budgets for the worst result of every endpoint across sizes."""
+    budgets = (
+        json.loads(BUDGETS_PATH.read_text(encoding='utf-8'))
+        if BUDGETS_PATH.exists() else {}
+    )
+    worst = {}
+    for measured in results.values():
+        for name, metrics in measured.items():
+            current = worst.setdefault(name, dict(metrics))
+            for metric, value in metrics.items():
+                current[metric] = max(current[metric], value)
+    budgets[profile] = {
+        name: {
+            'queries': metrics['queries'],
+            'p50_ms': ceil(metrics['p50_ms'] * LATENCY_HEADROOM),
+            'p95_ms': ceil(metrics['p95_ms'] * LATENCY_HEADROOM),
+            'alloc_kb': ceil(metrics['alloc_kb'] * ALLOCATION_HEADROOM),
+        }
+        for name, metrics in sorted(worst.items())
+    }
+    BUDGETS_PATH.write_text(
+        json.dumps(budgets, indent=2, ensure_ascii=False) + '\n',
+        encoding='utf-8',
+    )
+
+
+def check(measured, budgets, metrics=('queries', 'p50_ms', 'p95_ms',
+                                      'alloc_kb')):
+    """Return the (endpoint, metric, value, budget) over the budgets."""
+    exceeded = []
+    for name, values in measured.items():
+        budget = budgets.get(name)
+        if budget is None:
+            exceeded.append((name, 'budget', None, None))
+            continue
+        for metric in metrics:
+            if values[metric] > budget[metric]:
+                exceeded.append(
+                    (name, metric, values[metric], budget[metric])
+                )
+    return exceeded
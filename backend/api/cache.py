@@ -0,0 +1,195 @@
+import hashlib
+import time
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from foodgram_backend.db_router import read_primary_if_recent
+from foodgram_backend.metrics import cache_lookup
+from recipes.autocomplete import VERSION_KEY as PRODUCT_VERSION_KEY
+from rest_framework.response import Response
+
+LIST_VERSION_KEY = 'dish_list_version'
+SHARED_VERSION_KEY = 'dish_shared_version'
+
+response_cache_stats = Counter()
+
+
+def dish_version_key(dish_id):
+    return f'dish_version:{dish_id}'
+
+
+def user_version_key(user_id):
+    return f'user_relations_version:{user_id}'
+
+
+def new_version():
+    """Versions are write timestamps.
+
+    A key evicted from the cache, or expired after VERSION_KEY_TIMEOUT,
+    comes back with a newer value, which can never collide with an ETag
+    handed out earlier.
+    """
+    return time.time_ns()
+
+
+def set_versions(keys):
+    version = new_version()
+    cache.set_many(
+        {key: version for key in keys}, settings.VERSION_KEY_TIMEOUT
+    )
+
+
+def bump(*keys):
+    """Give `keys` new versions once the current transaction commits.
+
+    A read between the write and the commit would otherwise see the new
+    version with the old rows, and keep them under the new ETag.
+    """
+    transaction.on_commit(partial(set_versions, keys))
+
+
+def bump_dish(dish_id):
+    bump(dish_version_key(dish_id), LIST_VERSION_KEY)
+
+
+def bump_shared():
+    bump(SHARED_VERSION_KEY, LIST_VERSION_KEY)
+
+
+def bump_user(user_id):
+    bump(user_version_key(user_id))
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = new_version()
+        for key in missing:
+            cache.add(key, version, settings.VERSION_KEY_TIMEOUT)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+async def aget_versions(keys):
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = new_version()
+        for key in missing:
+            await cache.aadd(key, version, settings.VERSION_KEY_TIMEOUT)
+        versions.update(await cache.aget_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def version_keys(keys, user):
+    if user.is_authenticated:
+        return [*keys, user_version_key(user.id)]
+    return list(keys)
+
+
+def make_etag(request, user, versions):
+    """Return the ETag of a response.
+
+    There is no Last-Modified: with its one-second resolution, a write
+    in the same second as a read would still be answered with a 304.
+    """
+    return '"{}"'.format(hashlib.sha1('|'.join([
+        request.get_host(),
+        request.get_full_path(),
+        str(user.id),
+        *map(str, versions),
+    ]).encode()).hexdigest())
+
+
+def set_etag(response, etag):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def response_cache_key(etag):
+    return f'response:{etag}'
+
+
+class VersionedReadMixin:
+    """Conditional GET for list/retrieve, plus optional response caching.
+
+    Each view names the version keys its responses depend on; together
+    with the URL and, for authenticated users, their own relations
+    version they form the ETag. Requests whose If-None-Match matches get
+    a 304 before the queryset or serializer run. With `cache_responses`,
+    anonymous responses are also cached under the ETag.
+    """
+    cache_responses = False
+
+    def get_version_keys(self):
+        return [SHARED_VERSION_KEY]
+
+    def list(self, request, *args, **kwargs):
+        return self.versioned_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.versioned_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def versioned_response(self, view, request, *args, **kwargs):
+        user = request.user
+        versions = get_versions(version_keys(self.get_version_keys(), user))
+        read_primary_if_recent(versions)
+        etag = make_etag(request, user, versions)
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            if self.cache_responses and not user.is_authenticated:
+                response = self.cached_response(
+                    etag, view, request, *args, **kwargs
+                )
+            else:
+                response = view(request, *args, **kwargs)
+        return set_etag(response, etag)
+
+    def cached_response(self, etag, view, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE:
+            return view(request, *args, **kwargs)
+        response_cache = caches[settings.RESPONSE_CACHE_ALIAS]
+        key = response_cache_key(etag)
+        data = response_cache.get(key)
+        if data is not None:
+            response_cache_stats['hits'] += 1
+            cache_lookup('response', True)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response_cache_stats['misses'] += 1
+        cache_lookup('response', False)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(
+                key, response.data, settings.RESPONSE_CACHE_TIMEOUT
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class DishVersionMixin(VersionedReadMixin):
+    cache_responses = True
+
+    def get_version_keys(self):
+        if self.action == 'retrieve':
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            return [SHARED_VERSION_KEY, dish_version_key(lookup)]
+        return [LIST_VERSION_KEY]
+
+
+class ProductVersionMixin(VersionedReadMixin):
+
+    def get_version_keys(self):
+        return [PRODUCT_VERSION_KEY]
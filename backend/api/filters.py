@@ -1,34 +1,80 @@
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
 from django_filters import rest_framework as filters
+from recipes import search
+from recipes.matching import match_index
 from recipes.models import Dish, Product
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
 class DishFilter(filters.FilterSet):
     bookmarked = filters.BooleanFilter(method='filter_bookmarked')
     in_basket = filters.BooleanFilter(method='filter_in_basket')
+    search = filters.CharFilter(method='filter_search')
+    have = NumberInFilter(method='filter_have')
+    max_missing = filters.NumberFilter(
+        method='filter_max_missing', min_value=0
+    )
 
     class Meta:
         model = Dish
-        fields = ['creator', 'bookmarked', 'in_basket']
+        fields = [
+            'creator', 'bookmarked', 'in_basket', 'search',
+            'have', 'max_missing',
+        ]
 
     def filter_bookmarked(self, queryset, name, value):
         user = getattr(self.request, 'user', None)
         if user and user.is_authenticated and value:
-            return queryset.filter(favorited_by__user=user)
+            return queryset.filter(bookmarked_by__user=user)
         return queryset
 
     def filter_in_basket(self, queryset, name, value):
         user = getattr(self.request, 'user', None)
         if user and user.is_authenticated and value:
-            return queryset.filter(in_carts__user=user)
+            return queryset.filter(in_baskets__user=user)
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
+
+    def filter_have(self, queryset, name, value):
+        max_missing = self.form.cleaned_data.get('max_missing')
+        dish_ids = match_index.match(
+            [int(product_id) for product_id in value],
+            None if max_missing is None else int(max_missing),
+            settings.MATCH_RESULTS_LIMIT,
+        )
+        return queryset.filter(id__in=dish_ids).annotate(
+            match_rank=Case(
+                *(
+                    When(id=dish_id, then=Value(position))
+                    for position, dish_id in enumerate(dish_ids)
+                ),
+                output_field=IntegerField(),
+            )
+        ).order_by('match_rank', 'id')
+
+    def filter_max_missing(self, queryset, name, value):
+        # Applied together with `have` in filter_have.
         return queryset
 
 
 class ProductFilter(filters.FilterSet):
-    name = filters.CharFilter(
-        field_name='title',
-        lookup_expr='istartswith',
-    )
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Product
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        return queryset.filter(title__icontains=value).annotate(
+            prefix_rank=Case(
+                When(title__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('prefix_rank', 'title')
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from profiles.models import User
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.authentication import CachedTokenAuthentication, forget_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает стоимость аутентификации по токену на один запрос: '
+        'стандартная проверка DRF и кэшированная'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument(
+            '--email', help='Пользователь, чей токен проверяется'
+        )
+
+    def measure(self, authentication, request, count):
+        # Queries are counted on a separate pass: capturing them slows
+        # every query down and would skew the timing.
+        sample = min(count, 100)
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(sample):
+                authentication.authenticate(request)
+        started = time.perf_counter()
+        for _ in range(count):
+            authentication.authenticate(request)
+        elapsed = time.perf_counter() - started
+        return elapsed / count, len(queries) / sample
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['email']:
+            users = users.filter(email=options['email'])
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('Нет активного пользователя для проверки')
+        token, _ = Token.objects.get_or_create(user=user)
+        request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+        forget_tokens([token.key])
+        count = options['requests']
+        for name, authentication in (
+            ('TokenAuthentication', TokenAuthentication()),
+            ('CachedTokenAuthentication', CachedTokenAuthentication()),
+        ):
+            seconds, queries = self.measure(authentication, request, count)
+            self.stdout.write(
+                f'{name}: {seconds * 1e6:.1f} мкс и '
+                f'{queries:.2f} SQL-запросов на запрос'
+            )
@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет число SQL-запросов, задержки и выделение памяти '
+        'эндпоинтов API на тестовой базе и сверяет их с бюджетами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            action='append',
+            dest='sizes',
+            choices=list(benchmarks.SIZES),
+            help='Объём данных, можно несколько (по умолчанию small и '
+                 'medium)',
+        )
+        parser.add_argument('--repeats', type=int, default=20)
+        parser.add_argument(
+            '--update-budgets',
+            action='store_true',
+            help='Записать бюджеты по результатам замера',
+        )
+
+    def print_results(self, size, measured):
+        self.stdout.write(self.style.MIGRATE_HEADING(size))
+        self.stdout.write(
+            f'{"эндпоинт":<36}{"SQL":>5}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"память, КиБ":>14}'
+        )
+        for name, values in measured.items():
+            self.stdout.write(
+                f'{name:<36}{values["queries"]:>5}{values["p50_ms"]:>10}'
+                f'{values["p95_ms"]:>10}{values["alloc_kb"]:>14}'
+            )
+
+    def measure(self, sizes, repeats):
+        results = {}
+        for number, size in enumerate(sizes, start=1):
+            # Every size starts from an empty database.
+            call_command('flush', interactive=False, verbosity=0)
+            fixture = benchmarks.seed(**benchmarks.SIZES[size], seed=number)
+            results[size] = benchmarks.run(fixture, repeats)
+            self.print_results(size, results[size])
+        return results
+
+    def handle(self, *args, **options):
+        sizes = options['sizes'] or ['small', 'medium']
+        profile = connection.vendor
+        media_root = tempfile.mkdtemp()
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # The slow-request log would print set_password on every run.
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                IMAGE_PROCESSING_SYNC=True,
+                SLOW_REQUEST_MS=0,
+            ):
+                results = self.measure(sizes, options['repeats'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if options['update_budgets']:
+            benchmarks.save_budgets(profile, results)
+            self.stdout.write(self.style.SUCCESS(
+                f'Бюджеты профиля {profile} записаны в '
+                f'{benchmarks.BUDGETS_PATH.name}'))
+            return
+        budgets = benchmarks.load_budgets(profile)
+        if budgets is None:
+            self.stdout.write(self.style.WARNING(
+                f'Для профиля {profile} бюджетов нет, запустите с '
+                '--update-budgets'))
+            return
+        exceeded = [
+            (size, *item)
+            for size, measured in results.items()
+            for item in benchmarks.check(measured, budgets)
+        ]
+        for size, name, metric, value, budget in exceeded:
+            if metric == 'budget':
+                self.stderr.write(f'{size} {name}: нет бюджета')
+            else:
+                self.stderr.write(
+                    f'{size} {name}: {metric} = {value} > {budget}'
+                )
+        if exceeded:
+            raise CommandError('Бюджеты превышены')
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
@@ -0,0 +1,129 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = [
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/ingredients/?name=со',
+]
+
+
+class Worker(threading.Thread):
+    """Sends requests over one keep-alive connection until the deadline."""
+
+    def __init__(self, address, paths, headers, deadline):
+        super().__init__(daemon=True)
+        self.address = address
+        self.paths = [quote(path, safe='/?=&') for path in paths]
+        self.headers = headers
+        self.deadline = deadline
+        self.latencies = []
+        self.errors = 0
+
+    def connect(self):
+        scheme, host, port = self.address
+        connection_class = (
+            http.client.HTTPSConnection if scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        return connection_class(host, port, timeout=30)
+
+    def run(self):
+        connection = self.connect()
+        index = 0
+        while time.monotonic() < self.deadline:
+            path = self.paths[index % len(self.paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self.connect()
+                continue
+            if response.status >= 400:
+                self.errors += 1
+            self.latencies.append(time.perf_counter() - started)
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест GET-эндпоинтов запущенного сервера: '
+        'запросы в секунду и задержки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help=f'Путь запроса, можно несколько (по умолчанию '
+                 f'{", ".join(DEFAULT_PATHS)})',
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument(
+            '--token', help='Токен для авторизованных запросов'
+        )
+
+    def run_workers(self, address, paths, headers, concurrency, duration):
+        deadline = time.monotonic() + duration
+        workers = [
+            Worker(address, paths, headers, deadline)
+            for _ in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return workers, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError(f'Неверный адрес сервера: {options["url"]}')
+        address = (
+            url.scheme,
+            url.hostname,
+            url.port or (443 if url.scheme == 'https' else 80),
+        )
+        paths = options['paths'] or DEFAULT_PATHS
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        if options['warmup']:
+            self.run_workers(
+                address, paths, headers,
+                options['concurrency'], options['warmup'],
+            )
+        workers, elapsed = self.run_workers(
+            address, paths, headers,
+            options['concurrency'], options['duration'],
+        )
+        latencies = sorted(
+            latency for worker in workers for latency in worker.latencies
+        )
+        errors = sum(worker.errors for worker in workers)
+        if not latencies:
+            raise CommandError('Сервер не ответил ни на один запрос')
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(latencies)} запросов за {elapsed:.1f} с: '
+            f'{len(latencies) / elapsed:.0f} запросов/с, '
+            f'p50 {quantiles[49] * 1000:.1f} мс, '
+            f'p95 {quantiles[94] * 1000:.1f} мс, '
+            f'p99 {quantiles[98] * 1000:.1f} мс, '
+            f'ошибок {errors}'))
@@ -0,0 +1,253 @@
+import time
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from profiles.models import Follow, User
+from recipes import search
+from recipes.counters import recount
+from recipes.matching import reset as reset_match_index
+from recipes.models import Basket, Bookmark, Component, Dish, Product
+
+from api.cache import bump_shared
+
+DESCRIPTION = (
+    'Нарезать {first}, добавить {second} и готовить до готовности. '
+    'Подавать горячим.'
+)
+
+
+def title(first, second):
+    return (first if first == second else f'{first} с {second}')[:256]
+
+
+def zipf_weights(size, exponent):
+    """Probabilities of ranks 1..size under a Zipf law."""
+    weights = 1 / np.arange(1, size + 1, dtype=np.float64) ** exponent
+    return weights / weights.sum()
+
+
+def sample_pairs(rng, left, left_weights, right, right_weights, count,
+                 distinct=False):
+    """Draw up to `count` unique (left, right) id pairs.
+
+    Both sides are drawn from their own power law; pairs are encoded as
+    one integer so duplicates can be dropped with `np.unique`.
+    """
+    base = int(right.max()) + 1
+    pairs = np.empty(0, dtype=np.int64)
+    for _ in range(10):
+        missing = count - len(pairs)
+        if missing <= 0:
+            break
+        size = int(missing * 1.3) + 16
+        lefts = left[rng.choice(len(left), size, p=left_weights)]
+        rights = right[rng.choice(len(right), size, p=right_weights)]
+        if distinct:
+            keep = lefts != rights
+            lefts, rights = lefts[keep], rights[keep]
+        pairs = np.unique(np.concatenate([
+            pairs, lefts.astype(np.int64) * base + rights
+        ]))
+    pairs = rng.permutation(pairs)[:count]
+    return pairs // base, pairs % base
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, '
+        'избранным, корзинами и подписками для нагрузочных тестов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--dishes', type=int, default=10000)
+        parser.add_argument(
+            '--bookmarks', type=int,
+            help='По умолчанию два на рецепт',
+        )
+        parser.add_argument(
+            '--baskets', type=int,
+            help='По умолчанию один на два рецепта',
+        )
+        parser.add_argument(
+            '--follows', type=int,
+            help='По умолчанию пять на пользователя',
+        )
+        parser.add_argument('--min-components', type=int, default=3)
+        parser.add_argument('--max-components', type=int, default=12)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель степенного закона авторов и популярности',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--picture', default='dishes/load.png',
+            help='Путь картинки, общий для всех рецептов',
+        )
+
+    def report(self, name, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{name}: {count} за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-9):.0f}/с)'
+        )
+
+    def create_users(self, count, seed, batch_size):
+        prefix = f'load{seed}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с сидом {seed} уже созданы, укажите другой '
+                '--seed'
+            )
+        password = make_password('password')
+        ids = []
+        for start in range(0, count, batch_size):
+            users = User.objects.bulk_create([
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(start, min(start + batch_size, count))
+            ])
+            ids.extend(user.id for user in users)
+        return np.array(ids, dtype=np.int64)
+
+    def create_dishes(self, rng, count, authors, author_weights, options):
+        products = np.array(
+            Product.objects.order_by('id').values_list('id', flat=True),
+            dtype=np.int64,
+        )
+        titles = dict(Product.objects.values_list('id', 'title'))
+        product_weights = zipf_weights(len(products), options['zipf'])
+        # Popular products are spread over the catalog, not the first ids.
+        products = rng.permutation(products)
+        low = max(1, options['min_components'])
+        high = min(max(low, options['max_components']), len(products))
+        batch_size = options['batch_size']
+        dish_ids, components = [], 0
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            creators = authors[
+                rng.choice(len(authors), size, p=author_weights)
+            ]
+            lengths = rng.integers(low, high + 1, size)
+            drawn = products[rng.choice(
+                len(products), int(lengths.sum()), p=product_weights
+            )]
+            owners = np.repeat(np.arange(size), lengths)
+            # Repeated draws for one dish collapse into a single component.
+            base = int(products.max()) + 1
+            owners, drawn = np.divmod(np.unique(owners * base + drawn), base)
+            dish_numbers = np.arange(size)
+            first = drawn[np.searchsorted(owners, dish_numbers)]
+            last = drawn[np.searchsorted(owners, dish_numbers, 'right') - 1]
+            with transaction.atomic():
+                dishes = Dish.objects.bulk_create([
+                    Dish(
+                        creator_id=int(creators[index]),
+                        title=title(
+                            titles[int(first[index])],
+                            titles[int(last[index])],
+                        ),
+                        picture=options['picture'],
+                        description=DESCRIPTION.format(
+                            first=titles[int(first[index])],
+                            second=titles[int(last[index])],
+                        ),
+                        duration=int(rng.integers(5, 180)),
+                    )
+                    for index in range(size)
+                ])
+                ids = [dish.id for dish in dishes]
+                Component.objects.bulk_create([
+                    Component(
+                        dish_id=ids[owner],
+                        product_id=int(product),
+                        quantity=int(quantity),
+                    )
+                    for owner, product, quantity in zip(
+                        owners, drawn, rng.integers(1, 500, len(drawn))
+                    )
+                ], batch_size=batch_size)
+                search.refresh(ids)
+            dish_ids.extend(ids)
+            components += len(drawn)
+            self.stdout.write(f'  рецептов: {start + size} из {count}')
+        return np.array(dish_ids, dtype=np.int64), components
+
+    def create_relations(self, model, fields, pairs, batch_size):
+        lefts, rights = pairs
+        left_field, right_field = fields
+        for start in range(0, len(lefts), batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create([
+                    model(**{left_field: int(left), right_field: int(right)})
+                    for left, right in zip(
+                        lefts[start:start + batch_size],
+                        rights[start:start + batch_size],
+                    )
+                ])
+        return len(lefts)
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError(
+                'Каталог ингредиентов пуст: сначала выполните '
+                'import_ingredients'
+            )
+        users, dishes = options['users'], options['dishes']
+        if users < 2 or dishes < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт')
+        rng = np.random.default_rng(options['seed'])
+        batch_size = options['batch_size']
+        zipf = options['zipf']
+
+        started = time.perf_counter()
+        user_ids = self.create_users(users, options['seed'], batch_size)
+        self.report('Пользователи', users, started)
+
+        # Activity and popularity ranks are shuffled so they are not tied
+        # to the insertion order.
+        user_weights = zipf_weights(users, zipf)
+        authors = rng.permutation(user_ids)
+        started = time.perf_counter()
+        dish_ids, components = self.create_dishes(
+            rng, dishes, authors, user_weights, options
+        )
+        self.report('Рецепты', dishes, started)
+        self.stdout.write(f'Ингредиентов в рецептах: {components}')
+
+        dish_weights = zipf_weights(dishes, zipf)
+        relations = (
+            ('Избранное', Bookmark, ('user_id', 'dish_id'),
+             options['bookmarks'], dishes * 2, dish_ids, dish_weights),
+            ('Корзины', Basket, ('user_id', 'dish_id'),
+             options['baskets'], dishes // 2, dish_ids, dish_weights),
+            ('Подписки', Follow, ('user_id', 'following_id'),
+             options['follows'], users * 5, user_ids, user_weights),
+        )
+        for name, model, fields, count, default, targets, weights in (
+            relations
+        ):
+            started = time.perf_counter()
+            pairs = sample_pairs(
+                rng,
+                rng.permutation(user_ids), user_weights,
+                rng.permutation(targets), weights,
+                default if count is None else count,
+                distinct=model is Follow,
+            )
+            created = self.create_relations(model, fields, pairs, batch_size)
+            self.report(name, created, started)
+
+        with transaction.atomic():
+            recount()
+        reset_match_index()
+        bump_shared()
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы'))
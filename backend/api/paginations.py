@@ -1,6 +1,222 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Planner row estimate on PostgreSQL, exact COUNT(*) elsewhere."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
 
 
 class CustomPagination(PageNumberPagination):
+    """Page-number pagination with an optional `count` mode.
+
+    `?count=none` skips the COUNT(*) query and `?count=estimate` replaces
+    it with the planner estimate; both detect the next page by fetching
+    one extra row.
+    """
     page_size = 5
     page_size_query_param = 'limit'
+    count_query_param = 'count'
+    count_modes = ('exact', 'estimate', 'none')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = request.query_params.get(
+            self.count_query_param, 'exact'
+        )
+        if self.count_mode not in self.count_modes[1:]:
+            self.count_mode = 'exact'
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param) or 1
+            )
+            if self.page_number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.count = None
+        if self.count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.count_mode == 'exact':
+            return super().get_paginated_response(data)
+        url = self.request.build_absolute_uri()
+        next_link = previous_link = None
+        if self.has_next:
+            next_link = replace_query_param(
+                url, self.page_query_param, self.page_number + 1
+            )
+        if self.page_number == 2:
+            previous_link = remove_query_param(url, self.page_query_param)
+        elif self.page_number > 2:
+            previous_link = replace_query_param(
+                url, self.page_query_param, self.page_number - 1
+            )
+        return Response({
+            'count': self.count,
+            'next': next_link,
+            'previous': previous_link,
+            'results': data,
+        })
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a composite key.
+
+    The key fields come from the view's `cursor_ordering` and must share
+    one direction; the last one has to be unique (usually `id`).
+    """
+    page_size = 5
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return page_size
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def encode_cursor(self, obj, reverse):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in (getattr(obj, field) for field in self.fields)
+        ]
+        payload = json.dumps({'r': int(reverse), 'v': values})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            cursor,
+        )
+
+    def to_python(self, model, field, value):
+        try:
+            return model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            # Annotations such as a search rank keep their JSON value.
+            return value
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = [
+                self.to_python(model, field, value)
+                for field, value in zip(
+                    self.fields, payload['v'], strict=True
+                )
+            ]
+            return bool(payload['r']), values
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def filter_after(self, queryset, values, ascending):
+        lookup = 'gt' if ascending else 'lt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            equal = {
+                name: value
+                for name, value in zip(self.fields[:index], values)
+            }
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[index]})
+        first_bound = {f'{self.fields[0]}__{lookup}e': values[0]}
+        return queryset.filter(condition, **first_bound)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        self.fields = [field.lstrip('-') for field in ordering]
+        descending = ordering[0].startswith('-')
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse, values = cursor or (False, None)
+        ascending = descending == reverse
+        queryset = queryset.order_by(*(
+            field if ascending else f'-{field}' for field in self.fields
+        ))
+        if values is not None:
+            queryset = self.filter_after(queryset, values, ascending)
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class FeedPagination(CustomPagination):
+    """Page numbers by default, keyset cursors when asked for.
+
+    Cursor mode is enabled by `?pagination=cursor` and kept by the
+    `cursor` parameter of the next/previous links.
+    """
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (
+            request.query_params.get('pagination') == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        ):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
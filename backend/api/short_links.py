@@ -0,0 +1,165 @@
+import string
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from foodgram_backend.metrics import cache_lookup
+from recipes.models import Dish
+
+BASE62_ALPHABET = (
+    string.digits + string.ascii_uppercase + string.ascii_lowercase
+)
+BASE62_PREFIX = 'z'
+
+
+def encode(dish_id):
+    if settings.SHORT_LINK_FORMAT != 'base62':
+        return format(dish_id, 'x')
+    digits = []
+    while True:
+        dish_id, remainder = divmod(dish_id, 62)
+        digits.append(BASE62_ALPHABET[remainder])
+        if not dish_id:
+            break
+    return BASE62_PREFIX + ''.join(reversed(digits))
+
+
+def decode(short_id):
+    """Return the dish id of a short code; raise ValueError if malformed.
+
+    Base62 codes carry a prefix that is not a hex digit, so old hex codes
+    keep resolving.
+    """
+    if not short_id.startswith(BASE62_PREFIX):
+        dish_id = int(short_id, 16)
+    else:
+        dish_id = 0
+        for char in short_id[len(BASE62_PREFIX):]:
+            dish_id = dish_id * 62 + BASE62_ALPHABET.index(char)
+    if dish_id <= 0:
+        raise ValueError(short_id)
+    return dish_id
+
+
+def exists_key(dish_id):
+    return f'dish_exists:{dish_id}'
+
+
+def set_bit(bitmap, dish_id, value):
+    if dish_id >= settings.SHORT_LINK_MAX_BITMAP_ID:
+        return
+    byte = dish_id >> 3
+    if value:
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte + 1 - len(bitmap)))
+        bitmap[byte] |= 1 << (dish_id & 7)
+    elif byte < len(bitmap):
+        bitmap[byte] &= ~(1 << (dish_id & 7)) & 0xFF
+
+
+class DishIdIndex:
+    """Per-worker set of existing dish ids.
+
+    Ids are kept in a bitmap reloaded every SHORT_LINK_INDEX_TTL seconds
+    and updated by this worker's Dish signals. Ids outside it are checked
+    against the shared cache (filled by every worker's signals), then a
+    bounded LRU of recent answers, and only then the database.
+
+    Unknown ids are remembered only with SHARED_CACHE: otherwise a dish
+    created through another worker would 404 here until the next reload.
+    """
+
+    def __init__(self):
+        self.bitmap = bytearray()
+        self.recent = OrderedDict()
+        self.loaded_at = None
+        self.lock = Lock()
+
+    def in_bitmap(self, dish_id):
+        bitmap = self.bitmap
+        byte = dish_id >> 3
+        return byte < len(bitmap) and bool(
+            bitmap[byte] & (1 << (dish_id & 7))
+        )
+
+    def is_stale(self):
+        return (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at
+            > settings.SHORT_LINK_INDEX_TTL
+        )
+
+    def ensure_loaded(self):
+        if not self.is_stale():
+            return
+        with self.lock:
+            if not self.is_stale():
+                return
+            bitmap = bytearray()
+            ids = Dish.objects.order_by().values_list('id', flat=True)
+            for dish_id in ids.iterator():
+                set_bit(bitmap, dish_id, True)
+            self.bitmap = bitmap
+            self.recent.clear()
+            self.loaded_at = time.monotonic()
+
+    def remember(self, dish_id, exists):
+        with self.lock:
+            self.recent[dish_id] = exists
+            self.recent.move_to_end(dish_id)
+            while len(self.recent) > settings.SHORT_LINK_LRU_SIZE:
+                self.recent.popitem(last=False)
+
+    def recall(self, dish_id):
+        with self.lock:
+            exists = self.recent.get(dish_id)
+            if exists is not None:
+                self.recent.move_to_end(dish_id)
+            return exists
+
+    def exists(self, dish_id):
+        self.ensure_loaded()
+        if self.in_bitmap(dish_id):
+            cache_lookup('short_link', True)
+            return True
+        shared = cache.get(exists_key(dish_id))
+        if shared is not None:
+            cache_lookup('short_link', True)
+            if shared:
+                self.added(dish_id)
+            else:
+                self.removed(dish_id)
+            return shared
+        exists = self.recall(dish_id)
+        cache_lookup('short_link', exists is not None)
+        if exists is None:
+            exists = Dish.objects.filter(id=dish_id).exists()
+            if exists:
+                self.added(dish_id)
+            elif settings.SHARED_CACHE:
+                self.remember(dish_id, False)
+        return exists
+
+    def added(self, dish_id):
+        set_bit(self.bitmap, dish_id, True)
+        with self.lock:
+            self.recent.pop(dish_id, None)
+
+    def removed(self, dish_id):
+        set_bit(self.bitmap, dish_id, False)
+        self.remember(dish_id, False)
+
+
+dish_ids = DishIdIndex()
+
+
+def dish_saved(dish_id):
+    cache.set(exists_key(dish_id), True, settings.SHORT_LINK_INDEX_TTL)
+    dish_ids.added(dish_id)
+
+
+def dish_deleted(dish_id):
+    cache.set(exists_key(dish_id), False, settings.SHORT_LINK_INDEX_TTL)
+    dish_ids.removed(dish_id)
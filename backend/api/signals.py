@@ -0,0 +1,69 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from profiles.models import Follow, User
+from recipes.models import Basket, Bookmark, Component, Dish, Product
+from rest_framework.authtoken.models import Token
+
+from . import short_links
+from .authentication import SNAPSHOT_FIELDS, revoke_tokens, revoke_user_tokens
+from .cache import bump_dish, bump_shared, bump_user
+
+USER_PUBLIC_FIELDS = {
+    'email', 'username', 'first_name', 'last_name',
+    'avatar', 'avatar_variants',
+}
+
+
+@receiver([post_save, post_delete], sender=Dish)
+def invalidate_dish(sender, instance, **kwargs):
+    bump_dish(instance.id)
+
+
+@receiver(post_save, sender=Dish)
+def register_short_link(sender, instance, **kwargs):
+    short_links.dish_saved(instance.id)
+
+
+@receiver(post_delete, sender=Dish)
+def unregister_short_link(sender, instance, **kwargs):
+    short_links.dish_deleted(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Component)
+def invalidate_component(sender, instance, **kwargs):
+    bump_dish(instance.dish_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, **kwargs):
+    bump_shared()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, update_fields=None, **kwargs):
+    if update_fields and not USER_PUBLIC_FIELDS & set(update_fields):
+        return
+    bump_shared()
+
+
+@receiver(post_save, sender=User)
+def revoke_cached_tokens(sender, instance, created, update_fields=None,
+                         **kwargs):
+    # Password changes and deactivation both end up here.
+    if created or update_fields and not (
+        {*SNAPSHOT_FIELDS, 'password'} & set(update_fields)
+    ):
+        return
+    revoke_user_tokens(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(sender, instance, **kwargs):
+    revoke_tokens([instance.key])
+
+
+@receiver([post_save, post_delete], sender=Bookmark)
+@receiver([post_save, post_delete], sender=Basket)
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_user_relations(sender, instance, **kwargs):
+    bump_user(instance.user_id)
@@ -0,0 +1,1463 @@
+import asyncio
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import reportlab
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import (
+    AsyncRequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from foodgram_backend import db_router
+from foodgram_backend.image_field import Base64ImageField
+from prometheus_client import REGISTRY
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from profiles.models import Follow, User
+from recipes.models import Basket, Bookmark, Component, Dish, Product
+
+from . import async_views, authentication, benchmarks, short_links, utils
+from .authentication import TokenUserCache, local_tokens
+
+
+# Not about slow requests: keep their log line out of the test output.
+@override_settings(SLOW_REQUEST_MS=0)
+class DishListQueryCountTest(TestCase):
+    PAGE_SIZES = (5, 50, 500)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='Reader',
+            last_name='Reader',
+            password='password',
+        )
+        authors = User.objects.bulk_create([
+            User(
+                email=f'author{i}@example.com',
+                username=f'author{i}',
+                first_name='Author',
+                last_name=str(i),
+            ) for i in range(10)
+        ])
+        Follow.objects.bulk_create([
+            Follow(user=cls.user, following=author)
+            for author in authors[::2]
+        ])
+        products = Product.objects.bulk_create([
+            Product(title=f'product {i}', unit='г') for i in range(5)
+        ])
+        dishes = Dish.objects.bulk_create([
+            Dish(
+                creator=authors[i % len(authors)],
+                title=f'dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            ) for i in range(max(cls.PAGE_SIZES))
+        ])
+        Component.objects.bulk_create([
+            Component(dish=dish, product=product, quantity=1)
+            for dish in dishes for product in products[:3]
+        ])
+        Bookmark.objects.bulk_create([
+            Bookmark(user=cls.user, dish=dish) for dish in dishes[::3]
+        ])
+        Basket.objects.bulk_create([
+            Basket(user=cls.user, dish=dish) for dish in dishes[::4]
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def assert_constant_queries(self, client):
+        counts = set()
+        for size in self.PAGE_SIZES:
+            count, data = self.count_queries(
+                client, f'/api/recipes/?limit={size}'
+            )
+            self.assertEqual(len(data['results']), size)
+            counts.add(count)
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_anonymous_list_query_count_is_constant(self):
+        self.assert_constant_queries(APIClient())
+
+    def test_authenticated_list_query_count_is_constant(self):
+        client = APIClient()
+        token = Token.objects.create(user=self.user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        # The first request caches the token; the rest skip the lookup.
+        client.get('/api/recipes/?limit=1')
+        self.assert_constant_queries(client)
+
+    def test_flags_are_read_from_preloaded_data(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        _, data = self.count_queries(client, '/api/recipes/?limit=20')
+        for item in data['results']:
+            dish = Dish.objects.get(id=item['id'])
+            self.assertEqual(len(item['ingredients']), 3)
+            self.assertEqual(
+                item['creator']['is_subscribed'],
+                Follow.objects.filter(
+                    user=self.user, following=dish.creator
+                ).exists(),
+            )
+            self.assertEqual(
+                item['is_bookmarked'],
+                Bookmark.objects.filter(user=self.user, dish=dish).exists(),
+            )
+            self.assertEqual(
+                item['is_in_basket'],
+                Basket.objects.filter(user=self.user, dish=dish).exists(),
+            )
+
+    def test_retrieve_query_count(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        dish = Dish.objects.first()
+        with self.assertNumQueries(5):
+            response = client.get(f'/api/recipes/{dish.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_relation_flags_are_limited_to_page(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            client.get('/api/recipes/?limit=5')
+        relation_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "recipes_bookmark"' in query['sql']
+            or 'FROM "recipes_basket"' in query['sql']
+        ]
+        self.assertEqual(len(relation_queries), 2)
+        for sql in relation_queries:
+            self.assertIn('"dish_id" IN', sql)
+
+
+class ShoppingListExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com',
+            username='cook',
+            first_name='Cook',
+            last_name='Cook',
+            password='password',
+        )
+        flour, milk = Product.objects.bulk_create([
+            Product(title='мука', unit='г'),
+            Product(title='молоко', unit='мл'),
+        ])
+        dishes = Dish.objects.bulk_create([
+            Dish(
+                creator=cls.user,
+                title=f'dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            ) for i in range(3)
+        ])
+        Component.objects.bulk_create([
+            Component(dish=dishes[0], product=flour, quantity=100),
+            Component(dish=dishes[0], product=milk, quantity=200),
+            Component(dish=dishes[1], product=flour, quantity=50),
+            Component(dish=dishes[2], product=milk, quantity=1000),
+        ])
+        Basket.objects.bulk_create([
+            Basket(user=cls.user, dish=dish) for dish in dishes[:2]
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, file_format):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/recipes/export_shopping_list/',
+                {'format': file_format},
+            )
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content)
+        return response, content
+
+    def test_txt_is_aggregated(self):
+        response, content = self.export('txt')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        text = content.decode()
+        self.assertIn('- молоко (мл): 200', text)
+        self.assertIn('- мука (г): 150', text)
+
+    def test_csv_is_aggregated(self):
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[1:], ['молоко,мл,200', 'мука,г,150'])
+
+    def test_pdf(self):
+        response, content = self.export('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_pdf_uses_configured_font(self):
+        font = Path(reportlab.__file__).with_name('fonts') / 'Vera.ttf'
+        with override_settings(PDF_FONT_PATH=str(font)):
+            _, content = self.export('pdf')
+        # Fonts used on a page are embedded as a subset of their glyphs.
+        self.assertIn(b'+BitstreamVeraSans', content)
+
+    def test_missing_pdf_font_is_logged(self):
+        utils.cart_font.cache_clear()
+        self.addCleanup(utils.cart_font.cache_clear)
+        with override_settings(PDF_FONT_PATH='/nonexistent/font.ttf'), \
+                self.assertLogs('foodgram.export', 'ERROR'):
+            _, content = self.export('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_empty_cart(self):
+        Basket.objects.all().delete()
+        response = self.client.get('/api/recipes/export_shopping_list/')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RESPONSE_CACHE=True)
+class DishResponseCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='chef@example.com',
+            username='chef',
+            first_name='Chef',
+            last_name='Chef',
+            password='password',
+        )
+        cls.product = Product.objects.create(title='соль', unit='г')
+        cls.dish = Dish.objects.create(
+            creator=cls.user,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+        Component.objects.create(
+            dish=cls.dish, product=cls.product, quantity=5
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.detail_url = f'/api/recipes/{self.dish.id}/'
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_hit_skips_database(self):
+        self.assertEqual(self.get(self.detail_url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['title'], 'dish')
+
+    def test_dish_write_invalidates_detail_and_list(self):
+        self.get(self.detail_url)
+        self.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.title = 'renamed'
+            self.dish.save()
+        response = self.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'renamed')
+        response = self.get('/api/recipes/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_product_write_invalidates_detail(self):
+        self.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'морская соль'
+            self.product.save()
+        response = self.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(
+            response.json()['ingredients'][0]['title'], 'морская соль'
+        )
+
+    def test_versions_change_only_after_commit(self):
+        etag = self.get(self.detail_url)['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.dish.title = 'renamed'
+            self.dish.save()
+            # A read before the commit keeps the old version, so what it
+            # caches is never served under the new ETag.
+            self.assertEqual(self.get(self.detail_url)['ETag'], etag)
+        for callback in callbacks:
+            callback()
+        response = self.get(self.detail_url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['title'], 'renamed')
+
+    def test_authenticated_requests_are_not_cached(self):
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('X-Cache', self.get(self.detail_url))
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='etag@example.com',
+            username='etag',
+            first_name='Etag',
+            last_name='Etag',
+            password='password',
+        )
+        cls.dish = Dish.objects.create(
+            creator=cls.user,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+        Product.objects.create(title='соль', unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.detail_url = f'/api/recipes/{self.dish.id}/'
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.detail_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_no_second_resolution_validator(self):
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Last-Modified', response)
+        self.dish.title = 'renamed in the same second'
+        self.dish.save()
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SHARED_CACHE=False, VERSION_KEY_TIMEOUT=5)
+    def test_other_workers_writes_show_up_after_timeout(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        # Written by another worker: its version bump stays in its cache.
+        Dish.objects.filter(id=self.dish.id).update(title='renamed')
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        later = time.time() + 6
+        with mock.patch(
+            'django.core.cache.backends.locmem.time.time', return_value=later
+        ):
+            response = self.client.get(
+                self.detail_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'renamed')
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.title = 'renamed'
+            self.dish.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_own_relations_change_etag(self):
+        self.client.force_authenticate(self.user)
+        etag = self.client.get('/api/recipes/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Bookmark.objects.create(user=self.user, dish=self.dish)
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['is_bookmarked'])
+
+    def test_ingredients_follow_catalog_version(self):
+        url = '/api/ingredients/?name=со'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='сода', unit='г')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+class FeedPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='feed@example.com',
+            username='feed',
+            first_name='Feed',
+            last_name='Feed',
+            password='password',
+        )
+        Dish.objects.bulk_create([
+            Dish(
+                creator=cls.user,
+                title=f'dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            ) for i in range(12)
+        ])
+        created_at = Dish.objects.order_by('id').first().created_at
+        Dish.objects.filter(id__lte=Dish.objects.order_by('id')[5].id).update(
+            created_at=created_at
+        )
+        cls.expected = list(
+            Dish.objects.order_by('-created_at', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def ids(self, data):
+        return [item['id'] for item in data['results']]
+
+    def test_cursor_walks_forward_and_back(self):
+        data = self.client.get(
+            '/api/recipes/?pagination=cursor&limit=5'
+        ).json()
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['previous'])
+        pages = [self.ids(data)]
+        while data['next']:
+            with self.assertNumQueries(2):
+                data = self.client.get(data['next']).json()
+            pages.append(self.ids(data))
+        self.assertEqual(sum(pages, []), self.expected)
+
+        backwards = []
+        while data['previous']:
+            data = self.client.get(data['previous']).json()
+            backwards.insert(0, self.ids(data))
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_without_count(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/recipes/?count=none&page=2').json()
+        self.assertIsNone(data['count'])
+        self.assertEqual(self.ids(data), self.expected[5:10])
+        self.assertIsNotNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual(self.ids(data), self.expected[10:])
+        self.assertIsNone(data['next'])
+
+    def test_page_number_with_estimated_count(self):
+        data = self.client.get('/api/recipes/?count=estimate').json()
+        self.assertEqual(data['count'], len(self.expected))
+
+
+class SubscriptionsQueryCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='follower@example.com',
+            username='follower',
+            first_name='Follower',
+            last_name='Follower',
+            password='password',
+        )
+        cls.authors = User.objects.bulk_create([
+            User(
+                email=f'writer{i}@example.com',
+                username=f'writer{i:02}',
+                first_name='Writer',
+                last_name=str(i),
+            ) for i in range(12)
+        ])
+        Follow.objects.bulk_create([
+            Follow(user=cls.user, following=author)
+            for author in cls.authors
+        ])
+        Dish.objects.bulk_create([
+            Dish(
+                creator=author,
+                title=f'{author.username} dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            ) for author in cls.authors for i in range(6)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_page(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                f'/api/users/subscriptions/?limit={limit}&recipes_limit=3'
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()['results']
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        small_count, small = self.get_page(2)
+        large_count, large = self.get_page(12)
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(len(large), 12)
+
+    def test_latest_dishes_per_author(self):
+        _, results = self.get_page(12)
+        for author in results:
+            expected = list(
+                Dish.objects.filter(creator_id=author['id'])
+                .values_list('id', flat=True)[:3]
+            )
+            self.assertEqual(
+                [dish['id'] for dish in author['dishes']], expected
+            )
+            self.assertTrue(author['is_subscribed'])
+
+
+class DishSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='search@example.com',
+            username='search',
+            first_name='Search',
+            last_name='Search',
+            password='password',
+        )
+        cabbage = Product.objects.create(title='капуста', unit='г')
+        cls.dishes = {}
+        for title, description, product in (
+            ('щи', 'суп из капусты', cabbage),
+            ('капуста тушёная', 'гарнир', None),
+            ('салат', 'овощи', cabbage),
+            ('каша', 'крупа', None),
+        ):
+            dish = Dish.objects.create(
+                creator=cls.user,
+                title=title,
+                picture='dishes/test.png',
+                description=description,
+                duration=10,
+            )
+            if product:
+                Component.objects.create(
+                    dish=dish, product=product, quantity=1
+                )
+            cls.dishes[title] = dish
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def titles(self, response):
+        return [dish['title'] for dish in response.json()['results']]
+
+    def test_matches_are_ranked_by_field_weight(self):
+        response = self.client.get('/api/recipes/?search=капуст')
+        self.assertEqual(
+            self.titles(response), ['капуста тушёная', 'щи', 'салат']
+        )
+
+    def test_every_word_has_to_match(self):
+        response = self.client.get('/api/recipes/?search=капуст суп')
+        self.assertEqual(self.titles(response), ['щи'])
+
+    def test_cursor_pagination_follows_rank(self):
+        response = self.client.get('/api/recipes/', {
+            'search': 'капуст', 'pagination': 'cursor', 'limit': 1,
+        }).json()
+        titles = [dish['title'] for dish in response['results']]
+        url = response['next']
+        while url:
+            response = self.client.get(url).json()
+            titles += [dish['title'] for dish in response['results']]
+            url = response['next']
+        self.assertEqual(titles, ['капуста тушёная', 'щи', 'салат'])
+
+
+class BulkRelationsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = [
+            User.objects.create_user(
+                email=f'{name}@example.com',
+                username=name,
+                first_name=name,
+                last_name=name,
+                password='password',
+            )
+            for name in ('planner', 'author')
+        ]
+        cls.dishes = Dish.objects.bulk_create([
+            Dish(
+                creator=cls.author,
+                title=f'dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            )
+            for i in range(12)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, ids):
+        return self.client.post(url, {'ids': ids}, format='json')
+
+    def test_add_and_remove_cart_in_constant_queries(self):
+        url = '/api/recipes/shopping_cart/bulk/'
+        first, second = self.dishes[0].id, self.dishes[1].id
+        Basket.objects.create(user=self.user, dish=self.dishes[1])
+        with CaptureQueriesContext(connection) as small:
+            response = self.post(url, [first, second, 999999, first])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': first, 'status': 'created'},
+            {'id': second, 'status': 'exists'},
+            {'id': 999999, 'status': 'not_found'},
+        ])
+        with CaptureQueriesContext(connection) as large:
+            self.post(url, [dish.id for dish in self.dishes])
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Basket.objects.filter(user=self.user).count(), 12)
+        self.assertEqual(Dish.objects.get(id=first).basket_count, 1)
+
+        response = self.client.delete(
+            url, {'ids': [first, 999999]}, format='json'
+        )
+        self.assertEqual(response.json()['results'], [
+            {'id': first, 'status': 'deleted'},
+            {'id': 999999, 'status': 'not_found'},
+        ])
+        self.assertFalse(
+            Basket.objects.filter(user=self.user, dish_id=first).exists()
+        )
+        self.assertEqual(Dish.objects.get(id=first).basket_count, 0)
+
+    def test_rows_added_concurrently_are_not_counted(self):
+        dish = self.dishes[0]
+        raced = []
+
+        def concurrent_insert(execute, sql, params, many, context):
+            if sql.startswith('INSERT INTO "recipes_basket"') and not raced:
+                # Another request wins the race right before this INSERT.
+                raced.append(sql)
+                Basket.objects.bulk_create([
+                    Basket(user=self.user, dish=dish)
+                ])
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_insert):
+            response = self.post(
+                '/api/recipes/shopping_cart/bulk/', [dish.id]
+            )
+        self.assertEqual(
+            response.json()['results'], [{'id': dish.id, 'status': 'exists'}]
+        )
+        self.assertEqual(Dish.objects.get(id=dish.id).basket_count, 0)
+
+    def test_favorites_update_personal_flags(self):
+        dish = self.dishes[0]
+        self.client.get(f'/api/recipes/{dish.id}/')
+        self.post('/api/recipes/favorite/bulk/', [dish.id])
+        response = self.client.get(f'/api/recipes/{dish.id}/')
+        self.assertTrue(response.json()['is_bookmarked'])
+
+    def test_bulk_subscribe_rejects_self(self):
+        response = self.post(
+            '/api/users/subscribe/bulk/', [self.author.id, self.user.id]
+        )
+        self.assertEqual(response.json()['results'], [
+            {'id': self.author.id, 'status': 'created'},
+            {'id': self.user.id, 'status': 'invalid'},
+        ])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 1)
+
+    def test_ids_are_validated(self):
+        for ids in ([], ['x'], list(range(1, 200))):
+            response = self.post('/api/recipes/favorite/bulk/', ids)
+            self.assertEqual(response.status_code, 400)
+
+
+class RelationInsertTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = [
+            User.objects.create_user(
+                email=f'{name}@example.com',
+                username=name,
+                first_name=name,
+                last_name=name,
+                password='password',
+            )
+            for name in ('fan', 'chef')
+        ]
+        cls.dish = Dish.objects.create(
+            creator=cls.author,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_relations_are_added_once(self):
+        for url, model, counter in (
+            (f'/api/recipes/{self.dish.id}/favorite/', Bookmark,
+             'bookmark_count'),
+            (f'/api/recipes/{self.dish.id}/shopping_cart/', Basket,
+             'basket_count'),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.post(url).status_code, 201)
+            inserts = [
+                query['sql'] for query in queries
+                if query['sql'].startswith('INSERT')
+            ]
+            self.assertEqual(len(inserts), 1)
+            self.assertIn('ON CONFLICT DO NOTHING', inserts[0])
+            self.assertEqual(self.client.post(url).status_code, 400)
+            self.assertEqual(
+                model.objects.filter(user=self.user).count(), 1
+            )
+            self.dish.refresh_from_db()
+            self.assertEqual(getattr(self.dish, counter), 1)
+
+    def test_relations_are_removed_in_one_statement(self):
+        for url, model, counter in (
+            (f'/api/recipes/{self.dish.id}/favorite/', Bookmark,
+             'bookmark_count'),
+            (f'/api/recipes/{self.dish.id}/shopping_cart/', Basket,
+             'basket_count'),
+            (f'/api/users/{self.author.id}/subscribe/', Follow,
+             'follower_count'),
+        ):
+            self.assertEqual(self.client.post(url).status_code, 201)
+            table = model._meta.db_table
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.delete(url).status_code, 204)
+            touching = [
+                query['sql'] for query in queries
+                if f'"{table}"' in query['sql']
+            ]
+            self.assertEqual(len(touching), 1)
+            self.assertTrue(touching[0].startswith('DELETE'))
+            self.assertEqual(self.client.delete(url).status_code, 400)
+            target = self.author if model is Follow else self.dish
+            target.refresh_from_db()
+            self.assertEqual(getattr(target, counter), 0)
+
+    def test_subscribe_counts_new_follows_only(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 1)
+
+    def test_duplicates_are_rejected_by_the_database(self):
+        for model in (Bookmark, Basket):
+            model.objects.create(user=self.user, dish=self.dish)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                model.objects.create(user=self.user, dish=self.dish)
+
+
+# Not about slow requests: keep their log line out of the test output.
+@override_settings(SLOW_REQUEST_MS=0)
+class CachedTokenAuthenticationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='reader',
+            last_name='reader',
+            password='password',
+        )
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_cached_token_needs_no_auth_query(self):
+        self.assertEqual(self.me().status_code, 200)
+        local_tokens.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], self.user.email)
+        self.assertFalse(any(
+            'authtoken_token' in query['sql'] for query in queries
+        ))
+
+    def test_logout_revokes_cached_token(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_set_password_refreshes_cached_user(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'password',
+                'new_password': 'another-password-1',
+            })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('another-password-1'))
+        self.assertEqual(self.user.first_name, 'reader')
+        self.assertEqual(
+            cache.get(f'auth_token:{self.token.key}'), authentication.REVOKED
+        )
+
+    def test_deactivation_revokes_cached_token(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_revocation_is_not_undone_by_a_stale_read(self):
+        key = self.token.key
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks() as callbacks:
+            authentication.revoke_tokens([key])
+            # Nothing changes for other requests until the commit.
+            self.assertIsNotNone(cache.get(f'auth_token:{key}'))
+        for callback in callbacks:
+            callback()
+        # A request that read the rows before the commit finishes now.
+        self.assertIsNotNone(authentication.load_snapshot(key))
+        self.assertEqual(
+            cache.get(f'auth_token:{key}'), authentication.REVOKED
+        )
+        self.assertIsNone(authentication.cached_snapshot(key))
+
+    def revoke_in_another_worker(self, worker_cache):
+        with mock.patch.object(
+            authentication, 'cache', worker_cache
+        ), mock.patch.object(
+            authentication, 'local_tokens', TokenUserCache()
+        ), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_revocation_in_another_worker_without_shared_cache(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.revoke_in_another_worker(LocMemCache('another-worker', {}))
+        # The local LRU keeps serving the token for AUTH_TOKEN_LOCAL_TTL.
+        self.assertEqual(self.me().status_code, 200)
+        later = time.monotonic() + 6
+        with mock.patch(
+            'api.authentication.time.monotonic', return_value=later
+        ):
+            self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_revocation_in_another_worker_with_shared_cache(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.revoke_in_another_worker(cache)
+        later = time.monotonic() + 6
+        with mock.patch(
+            'api.authentication.time.monotonic', return_value=later
+        ):
+            self.assertEqual(self.me().status_code, 401)
+
+
+class ServerTimingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='timed@example.com',
+            username='timed',
+            first_name='timed',
+            last_name='timed',
+            password='password',
+        )
+        Dish.objects.bulk_create([
+            Dish(
+                creator=author,
+                title=f'dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            )
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def timings(self, response):
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    @override_settings(SERVER_TIMING=True, SLOW_REQUEST_MS=0)
+    def test_header_reports_queries_serializer_and_render(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/')
+        entries = self.timings(response)
+        self.assertEqual(
+            set(entries), {'db', 'serialize', 'render', 'total'}
+        )
+        self.assertEqual(
+            entries['db']['desc'], f'"{len(queries)} queries"'
+        )
+        self.assertGreater(float(entries['serialize']['dur']), 0)
+        self.assertGreater(float(entries['render']['dur']), 0)
+
+    @override_settings(
+        SERVER_TIMING=False,
+        SLOW_REQUEST_MS=0.001,
+        SLOW_REQUEST_SAMPLE_RATE=1.0,
+        SLOW_REQUEST_TOP_QUERIES=2,
+    )
+    def test_slow_request_is_logged_with_slowest_queries(self):
+        with self.assertLogs('foodgram.slow_requests') as logs:
+            response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'DishViewSet')
+        self.assertEqual(line['action'], 'list')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(len(line['slowest_queries']), 2)
+        self.assertGreaterEqual(
+            line['slowest_queries'][0]['ms'],
+            line['slowest_queries'][1]['ms'],
+        )
+
+
+class MetricsTest(TestCase):
+
+    PIXEL = (
+        'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk'
+        '+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+    )
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_multiprocess_directory_is_created_outside_gunicorn(self):
+        directory = Path(tempfile.mkdtemp()) / 'prometheus'
+        self.addCleanup(shutil.rmtree, directory.parent)
+        output = subprocess.run(
+            [sys.executable, '-c', (
+                'from foodgram_backend import metrics\n'
+                "metrics.cache_lookup('auth_token', True)\n"
+                'print(metrics.exposition()[0].decode())'
+            )],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(directory)},
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        self.assertIn(
+            'foodgram_cache_lookups_total{cache="auth_token",result="hit"}',
+            output,
+        )
+
+    def test_requests_are_counted_by_viewset_action(self):
+        labels = {
+            'endpoint': 'DishViewSet.list', 'method': 'GET', 'status': '200'
+        }
+        before = self.sample('foodgram_http_requests_total', **labels)
+        queries = self.sample(
+            'foodgram_http_request_db_queries_count',
+            endpoint='DishViewSet.list',
+        )
+        self.client.get('/api/recipes/')
+        self.assertEqual(
+            self.sample('foodgram_http_requests_total', **labels), before + 1
+        )
+        self.assertEqual(self.sample(
+            'foodgram_http_request_db_queries_count',
+            endpoint='DishViewSet.list',
+        ), queries + 1)
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'foodgram_http_request_duration_seconds_bucket{'
+            'endpoint="DishViewSet.list",le="0.005"}',
+            response.content.decode(),
+        )
+
+    @override_settings(RESPONSE_CACHE=True)
+    def test_response_cache_and_image_uploads_are_recorded(self):
+        misses = self.sample(
+            'foodgram_cache_lookups_total', cache='response', result='miss'
+        )
+        hits = self.sample(
+            'foodgram_cache_lookups_total', cache='response', result='hit'
+        )
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        self.assertEqual(self.sample(
+            'foodgram_cache_lookups_total', cache='response', result='miss'
+        ), misses + 1)
+        self.assertEqual(self.sample(
+            'foodgram_cache_lookups_total', cache='response', result='hit'
+        ), hits + 1)
+
+        class AvatarSerializer(serializers.Serializer):
+            avatar = Base64ImageField()
+
+        uploads = self.sample(
+            'foodgram_image_upload_bytes_sum', field='avatar'
+        )
+        serializer = AvatarSerializer(
+            data={'avatar': f'data:image/png;base64,{self.PIXEL}'}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(
+            self.sample('foodgram_image_upload_bytes_sum', field='avatar'),
+            uploads + len(base64.b64decode(self.PIXEL)),
+        )
+
+
+class GenerateLoadDataTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(title=f'продукт {i}', unit='г') for i in range(30)
+        ])
+
+    def generate(self, **options):
+        call_command(
+            'generate_load_data', stdout=StringIO(), batch_size=7, **options
+        )
+
+    def test_generates_requested_volumes_with_consistent_counters(self):
+        self.generate(users=12, dishes=40, bookmarks=60, follows=20, seed=3)
+        users = User.objects.filter(username__startswith='load3_')
+        self.assertEqual(users.count(), 12)
+        self.assertEqual(Dish.objects.count(), 40)
+        self.assertEqual(Bookmark.objects.count(), 60)
+        self.assertEqual(Basket.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), 20)
+        self.assertFalse(Follow.objects.filter(
+            user=F('following')
+        ).exists())
+        for dish in Dish.objects.all():
+            components = dish.components.count()
+            self.assertTrue(1 <= components <= 12)
+            self.assertEqual(
+                dish.bookmark_count, Bookmark.objects.filter(dish=dish).count()
+            )
+        self.assertEqual(
+            sum(users.values_list('recipe_count', flat=True)), 40
+        )
+        with self.assertRaises(CommandError):
+            self.generate(users=2, dishes=1, seed=3)
+
+
+class EndpointBudgetTest(TransactionTestCase):
+    """Query counts of every endpoint stay within the committed budgets.
+
+    A TransactionTestCase, so atomic blocks are real transactions and no
+    savepoint queries are counted, as in benchmark_endpoints.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            IMAGE_PROCESSING_SYNC=True,
+            SLOW_REQUEST_MS=0,
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_query_counts_are_within_budget(self):
+        budgets = benchmarks.load_budgets(connection.vendor)
+        if budgets is None:
+            self.skipTest(f'no budgets for {connection.vendor}')
+        fixture = benchmarks.seed(**benchmarks.SIZES['small'])
+        measured = benchmarks.run(fixture, repeats=2)
+        self.assertEqual(
+            benchmarks.check(measured, budgets, metrics=('queries',)), []
+        )
+
+
+class ShortLinkTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='sharer@example.com',
+            username='sharer',
+            first_name='Sharer',
+            last_name='Sharer',
+            password='password',
+        )
+
+    def setUp(self):
+        cache.clear()
+        short_links.dish_ids.loaded_at = None
+        self.dish = self.create_dish()
+
+    def create_dish(self):
+        return Dish.objects.create(
+            creator=self.user,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+
+    def resolve(self, code):
+        return self.client.get(f'/api/rec/{code}/')['Location']
+
+    def test_codes_round_trip(self):
+        for dish_id in (1, 61, 62, 255, 10 ** 12):
+            self.assertEqual(
+                short_links.decode(format(dish_id, 'x')), dish_id
+            )
+            with override_settings(SHORT_LINK_FORMAT='base62'):
+                code = short_links.encode(dish_id)
+            self.assertEqual(short_links.decode(code), dish_id)
+        for code in ('z', 'z!', '-1', 'xyz'):
+            with self.assertRaises(ValueError):
+                short_links.decode(code)
+
+    def test_hot_links_do_not_query_database(self):
+        expected = f'/recipes/{self.dish.id}/'
+        self.assertEqual(self.resolve(format(self.dish.id, 'x')), expected)
+        with override_settings(SHORT_LINK_FORMAT='base62'):
+            code = short_links.encode(self.dish.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(code), expected)
+
+    def test_signals_keep_index_fresh(self):
+        self.resolve('1')
+        dish = self.create_dish()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.resolve(format(dish.id, 'x')), f'/recipes/{dish.id}/'
+            )
+        dish_id = dish.id
+        dish.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(format(dish_id, 'x')), '/404')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_unknown_ids_are_remembered(self):
+        self.resolve('1')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.resolve('fffff'), '/404')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve('fffff'), '/404')
+
+    @override_settings(SHARED_CACHE=False)
+    def test_dishes_created_by_other_workers_resolve(self):
+        dish_id = self.dish.id + 100
+        code = format(dish_id, 'x')
+        self.assertEqual(self.resolve(code), '/404')
+        # Another worker's signals never reach this worker's cache.
+        Dish.objects.bulk_create([Dish(
+            id=dish_id,
+            creator=self.user,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )])
+        self.assertEqual(self.resolve(code), f'/recipes/{dish_id}/')
+
+
+class AsyncReadViewsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='async@example.com',
+            username='async',
+            first_name='Async',
+            last_name='Async',
+            password='password',
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        product = Product.objects.create(title='соль', unit='г')
+        for i in range(7):
+            dish = Dish.objects.create(
+                creator=cls.user,
+                title=f'dish {i}',
+                picture='dishes/test.png',
+                description='description',
+                duration=10,
+            )
+            Component.objects.create(dish=dish, product=product, quantity=i)
+        cls.dish = dish
+        Bookmark.objects.create(user=cls.user, dish=dish)
+        Follow.objects.create(
+            user=cls.user,
+            following=User.objects.create_user(
+                email='other@example.com', username='other',
+                first_name='Other', last_name='Other', password='password',
+            ),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, path, token=None, **kwargs):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        request = self.factory.get(path, headers=headers)
+        return async_to_sync(view)(request, **kwargs)
+
+    def assertSameAsSync(self, view, path, token=None, **kwargs):
+        client = APIClient()
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        expected = client.get(path)
+        cache.clear()
+        response = self.call(view, path, token, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), expected.json())
+        return response
+
+    def test_dish_list_matches_sync_view(self):
+        for token in (None, self.token.key):
+            for query in ('', '?page=2&limit=3', '?count=none', '?page=9'):
+                self.assertSameAsSync(
+                    async_views.dish_list, f'/api/recipes/{query}', token
+                )
+        self.assertSameAsSync(
+            async_views.dish_list,
+            '/api/recipes/?bookmarked=1',
+            self.token.key,
+        )
+
+    def test_dish_detail_matches_sync_view(self):
+        path = f'/api/recipes/{self.dish.id}/'
+        self.assertSameAsSync(
+            async_views.dish_detail, path, self.token.key, pk=self.dish.id
+        )
+        self.assertSameAsSync(
+            async_views.dish_detail, '/api/recipes/0/', pk=0
+        )
+
+    def test_users_and_ingredients_match_sync_views(self):
+        self.assertSameAsSync(
+            async_views.user_list, '/api/users/', self.token.key
+        )
+        self.assertSameAsSync(
+            async_views.user_detail,
+            f'/api/users/{self.user.id}/',
+            self.token.key,
+            pk=self.user.id,
+        )
+        self.assertSameAsSync(
+            async_views.ingredient_list, '/api/ingredients/?name=со'
+        )
+
+    def test_invalid_token_is_rejected(self):
+        response = self.call(async_views.dish_list, '/api/recipes/', 'bad')
+        self.assertEqual(response.status_code, 401)
+
+    def test_conditional_get_and_cursor_fallback(self):
+        etag = self.call(async_views.dish_list, '/api/recipes/')['ETag']
+        request = self.factory.get(
+            '/api/recipes/', headers={'If-None-Match': etag}
+        )
+        response = async_to_sync(async_views.dish_list)(request)
+        self.assertEqual(response.status_code, 304)
+        response = self.call(
+            async_views.dish_list, '/api/recipes/?pagination=cursor'
+        )
+        response.render()
+        self.assertIn('next', json.loads(response.content))
+
+    def test_cache_is_not_called_on_the_event_loop(self):
+        blocking = []
+
+        def spy(name):
+            original = getattr(cache, name)
+
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    blocking.append(name)
+                except RuntimeError:
+                    pass
+                return original(*args, **kwargs)
+            return mock.patch.object(cache, name, call)
+
+        with spy('get'), spy('get_many'), spy('add'), spy('set'):
+            for token in (None, self.token.key):
+                self.call(async_views.dish_list, '/api/recipes/', token)
+                self.call(
+                    async_views.dish_detail,
+                    f'/api/recipes/{self.dish.id}/',
+                    token,
+                    pk=self.dish.id,
+                )
+        self.assertEqual(blocking, [])
+
+    def test_short_link_redirect(self):
+        response = self.call(
+            async_views.short_link_redirect,
+            '/api/rec/x/',
+            short_id=format(self.dish.id, 'x'),
+        )
+        self.assertEqual(response.url, f'/recipes/{self.dish.id}/')
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaRoutingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='replica@example.com',
+            username='replica',
+            first_name='Replica',
+            last_name='Replica',
+            password='password',
+        )
+        cls.dish = Dish.objects.create(
+            creator=cls.user,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def replica_reads_during(self, method, url, after_write=10):
+        # Versions are created on first read: look at them from
+        # `after_write` seconds later, past REPLICA_STICKY_SECONDS.
+        later = time.time_ns() + after_write * 10 ** 9
+        with mock.patch.object(
+            db_router.random, 'choice', side_effect=lambda aliases: aliases[0]
+        ) as choice, mock.patch.object(
+            db_router, 'time', mock.Mock(time_ns=lambda: later)
+        ):
+            getattr(self.client, method)(url)
+        return choice.called
+
+    def test_safe_requests_read_from_replicas(self):
+        self.assertTrue(self.replica_reads_during('get', '/api/recipes/'))
+        self.assertTrue(self.replica_reads_during('get', '/api/ingredients/'))
+        self.assertFalse(db_router.replica_reads.get())
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.dish.id}/favorite/'
+        self.assertFalse(self.replica_reads_during('post', url))
+        self.assertFalse(self.replica_reads_during('get', '/api/recipes/'))
+        cache.delete(db_router.sticky_key(self.user.id))
+        self.assertTrue(self.replica_reads_during('get', '/api/recipes/'))
+
+    def test_everyone_reads_primary_right_after_a_write(self):
+        self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.title = 'renamed'
+            self.dish.save()
+        self.assertFalse(
+            self.replica_reads_during('get', '/api/recipes/', after_write=1)
+        )
+        self.assertTrue(
+            self.replica_reads_during('get', '/api/recipes/', after_write=6)
+        )
+
+    def test_router_keeps_writes_and_migrations_on_primary(self):
+        router = db_router.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Dish), 'default')
+        self.assertEqual(router.db_for_write(Dish), 'default')
+        self.assertFalse(router.allow_migrate('replica_1', 'recipes'))
@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet,
     DishViewSet,
     IngredientViewSet,
+    prometheus_metrics,
     short_link_redirect,
 )
 
@@ -19,4 +21,33 @@ urlpatterns = [
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
     path('rec/<str:short_id>/', short_link_redirect, name='short-link'),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        path('recipes/', async_views.dish_list, name='recipe-list'),
+        path(
+            'recipes/<int:pk>/',
+            async_views.dish_detail,
+            name='recipe-detail',
+        ),
+        path('users/', async_views.user_list, name='user-list'),
+        path(
+            'users/<int:pk>/',
+            async_views.user_detail,
+            name='user-detail',
+        ),
+        path(
+            'ingredients/',
+            async_views.ingredient_list,
+            name='ingredient-list',
+        ),
+        path(
+            'rec/<str:short_id>/',
+            async_views.short_link_redirect,
+            name='short-link',
+        ),
+    ] + urlpatterns
@@ -1,22 +1,188 @@
-from collections import defaultdict
+import csv
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
 
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Sum
+from foodgram_backend.rows import change_rows
+from recipes.counters import change_counter, change_counters
+from recipes.models import Component
 
-def generate_cart_text(items):
-    ingredients_total = defaultdict(lambda: {'amount': 0, 'unit': ''})
+from .cache import bump_user
 
-    for item in items:
-        recipe = item.recipe
-        for ingredient in recipe.ingredient_amounts \
-                .select_related('ingredient'):
-            key = ingredient.ingredient.name
-            unit = ingredient.ingredient.measurement_unit
-            ingredients_total[key]['amount'] += ingredient.amount
-            ingredients_total[key]['unit'] = unit
+logger = logging.getLogger('foodgram.export')
 
-    lines = ["Список покупок:\n"]
-    for name, data in sorted(ingredients_total.items()):
-        lines.append(f"- {name} ({data['unit']}): {data['amount']}")
 
-    cart_text = '\n'.join(lines)
+class Echo:
+    def write(self, value):
+        return value
 
-    return cart_text
+
+def insert_ignoring_conflicts(model, **values):
+    """INSERT ... ON CONFLICT DO NOTHING; return whether a row was added.
+
+    Relies on a unique constraint of `model`: a concurrent insert of the
+    same row is skipped by the database instead of raising.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(model._meta.get_field(name).column) for name in values
+    )
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+            list(values.values()),
+        )
+        return cursor.rowcount > 0
+
+
+def add_relation(user, model, field, pk, counter):
+    """Add one of the user's `model` rows pointing at `pk`.
+
+    A single statement; signals are bypassed, so the counter and cache
+    are updated here, and only when the row was actually inserted.
+    """
+    target = model._meta.get_field(field).related_model
+    if not insert_ignoring_conflicts(model, user=user.id, **{field: pk}):
+        return False
+    change_counter(target, pk, counter, 1)
+    bump_user(user.id)
+    return True
+
+
+def remove_relation(user, model, field, pk, counter):
+    """Remove the user's `model` row pointing at `pk`, if there is one.
+
+    The counterpart of add_relation: one DELETE, with the counter and
+    cache updated only when it removed a row.
+    """
+    target = model._meta.get_field(field).related_model
+    if not change_rows(model, 'user', user.id, field, [pk], add=False):
+        return False
+    change_counter(target, pk, counter, -1)
+    bump_user(user.id)
+    return True
+
+
+def change_relations(user, ids, model, field, counter, add, forbidden=()):
+    """Add or remove the user's `model` rows pointing at `ids`.
+
+    Runs a fixed number of queries whatever the number of ids and returns
+    a status per id, in request order. Signals are bypassed, so the
+    counter and cache updates their receivers make are done here, for
+    the rows that were actually inserted or deleted.
+    """
+    target = model._meta.get_field(field).related_model
+    ids = list(dict.fromkeys(ids))
+    found = set(
+        target.objects.filter(pk__in=ids).values_list('pk', flat=True)
+    )
+    changed = change_rows(
+        model,
+        'user',
+        user.id,
+        field,
+        [pk for pk in ids if pk in found and not (add and pk in forbidden)],
+        add,
+    )
+    if changed:
+        change_counters(target, changed, counter, 1 if add else -1)
+        bump_user(user.id)
+
+    statuses = ('created', 'exists') if add else ('deleted', 'absent')
+    results = []
+    for pk in ids:
+        if pk not in found:
+            status = 'not_found'
+        elif add and pk in forbidden:
+            status = 'invalid'
+        else:
+            status = statuses[pk not in changed]
+        results.append({'id': pk, 'status': status})
+    return results
+
+
+def get_shopping_list(user):
+    return (
+        Component.objects
+        .filter(dish__in_baskets__user=user)
+        .values('product__title', 'product__unit')
+        .annotate(total=Sum('quantity'))
+        .order_by('product__title')
+    )
+
+
+def generate_cart_text(rows):
+    yield 'Список покупок:\n\n'
+    for row in rows:
+        yield (
+            f"- {row['product__title']} ({row['product__unit']}): "
+            f"{row['total']}\n"
+        )
+
+
+def generate_cart_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Ингредиент', 'Мера', 'Количество'])
+    for row in rows:
+        yield writer.writerow(
+            [row['product__title'], row['product__unit'], row['total']]
+        )
+
+
+@lru_cache
+def cart_font(path):
+    """Register the TTF font at `path` once and return its name.
+
+    The built-in Helvetica has no Cyrillic glyphs, so a missing font is
+    logged as an error: the list would come out as empty boxes.
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        pdfmetrics.registerFont(TTFont(name, path))
+    except (OSError, TTFError):
+        logger.exception('Не удалось загрузить шрифт PDF %s', path)
+        return 'Helvetica'
+    return name
+
+
+def generate_cart_pdf(rows):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    font_name = cart_font(settings.PDF_FONT_PATH)
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - 50
+    pdf.setFont(font_name, 16)
+    pdf.drawString(50, y, 'Список покупок:')
+    pdf.setFont(font_name, 12)
+    for line in generate_cart_text(rows):
+        if not line.startswith('- '):
+            continue
+        y -= 20
+        if y < 50:
+            pdf.showPage()
+            pdf.setFont(font_name, 12)
+            y = height - 50
+        pdf.drawString(50, y, line.rstrip('\n'))
+    pdf.save()
+    yield buffer.getvalue()
+
+
+CART_GENERATORS = {
+    'txt': generate_cart_text,
+    'csv': generate_cart_csv,
+    'pdf': generate_cart_pdf,
+}
@@ -1,8 +1,21 @@
-from django.db.models import Count
-from django.http import HttpResponse, HttpResponseRedirect, Http404
-from django.shortcuts import get_object_or_404
+from collections import defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
+from foodgram_backend import metrics
+from foodgram_backend.db_router import ReplicaReadMixin
+from foodgram_backend.timing import ServerTimingMixin
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import viewsets, status
@@ -14,28 +27,56 @@ from profiles.serializers import (
     SetPasswordSerializer,
 )
 from profiles.models import Follow, User
-from recipes.models import Dish, Basket, Bookmark, Ingredient
+from recipes.autocomplete import product_index
+from recipes.models import Dish, Basket, Bookmark, Component, Product
 from recipes.serializers import (
-    DishSerializer,
-    DishCreateSerializer,
+    BulkIdsSerializer,
+    DishReadSerializer,
+    DishWriteSerializer,
     DishShortSerializer,
-    IngredientSerializer,
-    FollowSerializer,
+    ProductSerializer,
+    SubscriptionSerializer,
+)
+from . import short_links
+from .cache import (
+    DishVersionMixin,
+    ProductVersionMixin,
+    VersionedReadMixin,
+    bump_dish,
 )
-from .paginations import CustomPagination
+from .paginations import FeedPagination
 from .permissions import OwnerOrReadOnly
-from .filters import DishFilter, IngredientFilter
-from .utils import generate_cart_text
+from .filters import DishFilter, ProductFilter
+from .renderers import (
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+    TextShoppingListRenderer,
+)
+from .utils import (
+    CART_GENERATORS,
+    add_relation,
+    change_relations,
+    get_shopping_list,
+    remove_relation,
+)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(
+    ServerTimingMixin,
+    ReplicaReadMixin,
+    VersionedReadMixin,
+    viewsets.ModelViewSet,
+):
     queryset = User.objects.all()
-    pagination_class = CustomPagination
+    pagination_class = FeedPagination
+    cursor_ordering = ('username', 'id')
     permission_classes = [AllowAny]
 
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
+        if self.action in {'subscriptions', 'subscribe'}:
+            return SubscriptionSerializer
         return UserSerializer
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated], url_path="me")
@@ -61,43 +102,68 @@ class UserViewSet(viewsets.ModelViewSet):
         if user.avatar:
             user.avatar.delete(save=False)
             user.avatar = None
-            user.save()
+            user.save(update_fields=['avatar'])
         return Response({}, status=204)
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        recipes_limit = request.query_params.get('recipes_limit')
-        queryset = User.objects.filter(following__user=user).annotate(recipes_count=Count('recipe'))
+        queryset = User.objects.filter(following__user=user)
         page = self.paginate_queryset(queryset)
-        context = self.build_follow_context(request)
-        serializer = FollowSerializer(page, many=True, context=context)
+        context = self.build_follow_context(request, page)
+        serializer = self.get_serializer(page, many=True, context=context)
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def subscribe(self, request, pk=None):
         user = request.user
         author = self.get_object()
 
-        if author == user or Follow.objects.filter(user=user, following=author).exists():
+        if author == user or not add_relation(
+            user, Follow, 'following', author.id, 'follower_count'
+        ):
             return Response({}, status=400)
 
-        Follow.objects.create(user=user, following=author)
-        serializer = FollowSerializer(author, context=self.build_follow_context(request))
+        serializer = self.get_serializer(
+            author, context=self.build_follow_context(request, [author])
+        )
         return Response(serializer.data, status=201)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def unsubscribe(self, request, pk=None):
         user = request.user
         author = self.get_object()
-        relation = Follow.objects.filter(user=user, following=author)
 
-        if not relation.exists():
+        if not remove_relation(
+            user, Follow, 'following', author.id, 'follower_count'
+        ):
             return Response({}, status=400)
 
-        relation.delete()
         return Response({}, status=204)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe/bulk',
+    )
+    @transaction.atomic
+    def subscribe_bulk(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = change_relations(
+            request.user,
+            serializer.validated_data['ids'],
+            Follow,
+            'following',
+            'follower_count',
+            add=request.method == 'POST',
+            forbidden={request.user.id},
+        )
+        return Response({'results': results}, status=200)
+
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='set_password')
     def set_password(self, request):
         serializer = SetPasswordSerializer(data=request.data)
@@ -107,107 +173,244 @@ class UserViewSet(viewsets.ModelViewSet):
                 return Response({'current_password': ['Неверный пароль.']}, status=400)
 
             user.set_password(serializer.validated_data['new_password'])
-            user.save()
+            user.save(update_fields=['password'])
             return Response({}, status=204)
         return Response(serializer.errors, status=400)
 
-    def build_follow_context(self, request):
+    def build_follow_context(self, request, authors):
+        limit = request.query_params.get('recipes_limit')
+        dishes = Dish.objects.filter(creator__in=authors).defer(
+            'search_vector'
+        )
+        if limit and limit.isdigit():
+            dishes = dishes.annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F('creator'),
+                    order_by=(F('created_at').desc(), F('id').desc()),
+                )
+            ).filter(position__lte=int(limit))
+        author_dishes = defaultdict(list)
+        for dish in dishes:
+            author_dishes[dish.creator_id].append(dish)
         return {
             'request': request,
-            'recipes_limit': request.query_params.get('recipes_limit')
+            'author_dishes': author_dishes,
+            'subscribed_ids': {author.id for author in authors},
         }
 
 
-class DishViewSet(viewsets.ModelViewSet):
-    queryset = Dish.objects.all()
-    pagination_class = CustomPagination
+class DishViewSet(
+    ServerTimingMixin,
+    ReplicaReadMixin,
+    DishVersionMixin,
+    viewsets.ModelViewSet,
+):
+    queryset = Dish.objects.select_related('creator').prefetch_related(
+        Prefetch(
+            'components',
+            queryset=Component.objects.select_related('product'),
+        )
+    ).defer('search_vector')
+    pagination_class = FeedPagination
     permission_classes = [OwnerOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = DishFilter
 
+    @property
+    def cursor_ordering(self):
+        if self.request.query_params.get('have'):
+            return ('match_rank', 'id')
+        if self.request.query_params.get('search'):
+            return ('-search_rank', '-id')
+        return ('-created_at', '-id')
+
     def get_serializer_class(self):
         if self.action in {'create', 'update', 'partial_update'}:
-            return DishCreateSerializer
-        return DishSerializer
+            return DishWriteSerializer
+        return DishReadSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
+        serializer.save(creator=self.request.user)
+        bump_dish(serializer.instance.id)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_dish(serializer.instance.id)
+
+    def get_serializer(self, *args, **kwargs):
+        context = kwargs.setdefault('context', self.get_serializer_context())
+        if args and args[0] is not None:
+            context.update(self.build_page_context(args[0]))
+        return super().get_serializer(*args, **kwargs)
+
+    def build_page_context(self, dishes):
+        if isinstance(dishes, Dish):
+            dishes = [dishes]
         user = self.request.user
-        favorites = Bookmark.objects.filter(user=user).values_list('recipe_id', flat=True) if user.is_authenticated else []
-        shopping = Basket.objects.filter(user=user).values_list('recipe_id', flat=True) if user.is_authenticated else []
-        context.update({
-            'favorited_ids': set(favorites),
-            'shopping_cart_ids': set(shopping),
-        })
-        return context
+        if not user.is_authenticated:
+            return {
+                'subscribed_ids': set(),
+                'bookmarked_ids': set(),
+                'basket_ids': set(),
+            }
+        dish_ids = {dish.id for dish in dishes}
+        creator_ids = {dish.creator_id for dish in dishes}
+        return {
+            'subscribed_ids': set(
+                Follow.objects.filter(
+                    user=user, following_id__in=creator_ids
+                ).order_by().values_list('following_id', flat=True)
+            ),
+            'bookmarked_ids': self.related_dish_ids(Bookmark, dish_ids),
+            'basket_ids': self.related_dish_ids(Basket, dish_ids),
+        }
+
+    def related_dish_ids(self, model, dish_ids):
+        return set(
+            model.objects.filter(
+                user=self.request.user, dish_id__in=dish_ids
+            ).values_list('dish_id', flat=True)
+        )
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def shorten_link(self, request, pk=None):
-        recipe = self.get_object()
-        short_id = format(recipe.id, 'x')
+        dish = self.get_object()
+        short_id = short_links.encode(dish.id)
         short_path = reverse('api:short-link', kwargs={'short_id': short_id})
         full_url = request.build_absolute_uri(short_path)
         return Response({'short-link': full_url}, status=200)
 
-    def add_user_relation(self, request, model):
-        recipe = self.get_object()
-        user = request.user
-        if model.objects.filter(user=user, recipe=recipe).first():
+    @transaction.atomic
+    def add_user_relation(self, request, model, counter):
+        dish = self.get_object()
+        if not add_relation(request.user, model, 'dish', dish.id, counter):
             return Response({}, status=400)
-        model.objects.create(user=user, recipe=recipe)
-        return Response(DishShortSerializer(recipe).data, status=201)
+        return Response(DishShortSerializer(dish).data, status=201)
 
-    def remove_user_relation(self, request, model):
-        recipe = self.get_object()
-        user = request.user
-        relation = model.objects.filter(user=user, recipe=recipe)
-        if not relation.exists():
+    @transaction.atomic
+    def remove_user_relation(self, request, model, counter):
+        dish = self.get_object()
+        if not remove_relation(request.user, model, 'dish', dish.id, counter):
             return Response({}, status=400)
-        relation.delete()
         return Response({}, status=204)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
-        return self.add_user_relation(request, Bookmark)
+        return self.add_user_relation(request, Bookmark, 'bookmark_count')
 
     @favorite.mapping.delete
     def remove_favorite(self, request, pk=None):
-        return self.remove_user_relation(request, Bookmark)
+        return self.remove_user_relation(request, Bookmark, 'bookmark_count')
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
-        return self.add_user_relation(request, Basket)
+        return self.add_user_relation(request, Basket, 'basket_count')
 
     @shopping_cart.mapping.delete
     def remove_from_shopping_cart(self, request, pk=None):
-        return self.remove_user_relation(request, Basket)
-
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+        return self.remove_user_relation(request, Basket, 'basket_count')
+
+    @transaction.atomic
+    def change_user_relations(self, request, model, counter):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = change_relations(
+            request.user,
+            serializer.validated_data['ids'],
+            model,
+            'dish',
+            counter,
+            add=request.method == 'POST',
+        )
+        return Response({'results': results}, status=200)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/bulk',
+    )
+    def favorite_bulk(self, request):
+        return self.change_user_relations(
+            request, Bookmark, 'bookmark_count'
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        return self.change_user_relations(request, Basket, 'basket_count')
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            PDFShoppingListRenderer,
+        ],
+    )
     def export_shopping_list(self, request):
-        user = request.user
-        items = Basket.objects.filter(user=user).select_related('recipe')
-        if not items.exists():
+        rows = get_shopping_list(request.user).iterator()
+        first = next(rows, None)
+        if first is None:
             return Response({}, status=400)
-        content = generate_cart_text(items)
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="shopping_cart.txt"'
+        renderer = request.accepted_renderer
+        content = CART_GENERATORS[renderer.format](chain([first], rows))
+        response = StreamingHttpResponse(
+            content, content_type=renderer.media_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
         return response
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Ingredient.objects.all()
-    serializer_class = IngredientSerializer
+class IngredientViewSet(
+    ServerTimingMixin,
+    ReplicaReadMixin,
+    ProductVersionMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_class = IngredientFilter
+    filterset_class = ProductFilter
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.versioned_response(self.search, request)
+
+    def search(self, request):
+        name = request.query_params['name']
+        limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        if settings.INGREDIENT_INDEX_IN_MEMORY:
+            products = product_index.search(name, limit)
+        else:
+            products = self.filter_queryset(self.get_queryset())[:limit]
+        return Response(self.get_serializer(products, many=True).data)
 
 
 def short_link_redirect(request, short_id):
     try:
-        recipe_id = int(short_id, 16)
-        recipe = get_object_or_404(Dish, id=recipe_id)
-        return HttpResponseRedirect(f'/recipes/{recipe.id}/')
-    except (ValueError, Http404):
+        dish_id = short_links.decode(short_id)
+    except ValueError:
+        return HttpResponseRedirect('/404')
+    if not short_links.dish_ids.exists(dish_id):
         return HttpResponseRedirect('/404')
+    return HttpResponseRedirect(f'/recipes/{dish_id}/')
+
+
+def prometheus_metrics(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    data, content_type = metrics.exposition()
+    return HttpResponse(data, content_type=content_type)
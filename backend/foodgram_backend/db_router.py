@@ -0,0 +1,95 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+def sticky_key(user_id):
+    return f'db_sticky:{user_id}'
+
+
+def mark_written(user):
+    """Keep the user's reads on the primary until replicas catch up."""
+    if user.is_authenticated and settings.REPLICA_STICKY_SECONDS:
+        cache.set(
+            sticky_key(user.id), True, settings.REPLICA_STICKY_SECONDS
+        )
+
+
+def can_read_from_replica(method, user):
+    return (
+        bool(settings.DATABASE_REPLICAS)
+        and method in SAFE_METHODS
+        and not (user.is_authenticated and cache.get(sticky_key(user.id)))
+    )
+
+
+async def acan_read_from_replica(method, user):
+    return (
+        bool(settings.DATABASE_REPLICAS)
+        and method in SAFE_METHODS
+        and not (
+            user.is_authenticated
+            and await cache.aget(sticky_key(user.id))
+        )
+    )
+
+
+def read_primary_if_recent(versions):
+    """Keep the request's reads on the primary after a recent write.
+
+    Versions are write timestamps, and the ETag and response cache key
+    are made of them. While the newest is younger than
+    REPLICA_STICKY_SECONDS, a lagging replica could still return the
+    rows from before that write under the new ETag, whoever wrote.
+    """
+    age = time.time_ns() - max(versions, default=0)
+    if replica_reads.get() and age < settings.REPLICA_STICKY_SECONDS * 1e9:
+        replica_reads.set(False)
+
+
+class ReplicaRouter:
+    """Send reads of safe requests to a replica, everything else to default.
+
+    Reads are routed to replicas only inside requests that opted in
+    through `replica_reads` (see ReplicaReadMixin); management commands,
+    signals and writes keep using the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """Serve safe requests of a DRF view from the read replicas."""
+
+    def initial(self, request, *args, **kwargs):
+        self.replica_token = replica_reads.set(
+            can_read_from_replica(request.method, request.user)
+        )
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            replica_reads.reset(token)
+            self.replica_token = None
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_written(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
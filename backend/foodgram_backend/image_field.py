@@ -5,6 +5,9 @@ from rest_framework import serializers
 from PIL import Image
 from io import BytesIO
 
+from .images import strip_metadata
+from .metrics import image_uploaded
+
 MAX_IMAGE_SIZE = 3 * 1024 * 1024
 
 class Base64ImageField(serializers.ImageField):
@@ -21,6 +24,8 @@ class Base64ImageField(serializers.ImageField):
             except (ValueError, TypeError, base64.binascii.Error):
                 raise serializers.ValidationError('Неверный формат base64 изображения.')
 
+            image_uploaded(self.field_name, len(file_data))
+
             if len(file_data) > MAX_IMAGE_SIZE:
                 raise serializers.ValidationError('Размер изображения превышает 5MB.')
 
@@ -31,7 +36,36 @@ class Base64ImageField(serializers.ImageField):
                 raise serializers.ValidationError('Загруженный файл не является изображением.')
 
             file_name = f'{uuid.uuid4()}.{ext}'
-            return ContentFile(file_data, name=file_name)
+            return ContentFile(strip_metadata(file_data), name=file_name)
 
         return super().to_internal_value(data)
 
+
+class ImageVariantsField(serializers.Field):
+    """Absolute URLs of the pre-generated sizes of an image field.
+
+    Empty until the variants of the current file have been rendered.
+    """
+
+    def __init__(self, image_field, variants_field, **kwargs):
+        self.image_field = image_field
+        self.variants_field = variants_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        file = getattr(instance, self.image_field)
+        variants = getattr(instance, self.variants_field)
+        if not file or variants.get('source') != file.name:
+            return {}
+        request = self.context.get('request')
+        result = {}
+        for variant, paths in variants['files'].items():
+            result[variant] = {}
+            for extension, path in paths.items():
+                url = file.storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                result[variant][extension] = url
+        return result
@@ -0,0 +1,158 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from PIL import Image, ImageOps
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+def variant_path(name, variant, extension):
+    base, _ = os.path.splitext(name)
+    return f'{base}_{variant}.{extension}'
+
+
+def encode(image, file_format, options):
+    buffer = BytesIO()
+    if file_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    # Saving without exif/icc arguments drops the source metadata.
+    image.save(buffer, file_format, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(data):
+    """Re-encode uploaded image bytes without EXIF/XMP metadata.
+
+    The EXIF orientation is applied to the pixels first. Animated images
+    are returned unchanged, as re-encoding would keep only one frame;
+    MPO photos of some cameras are stored as their primary JPEG image.
+    """
+    image = Image.open(BytesIO(data))
+    file_format = 'JPEG' if image.format == 'MPO' else image.format
+    if file_format != 'JPEG' and getattr(image, 'n_frames', 1) > 1:
+        return data
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if file_format == 'JPEG':
+        options['quality'] = 95
+    buffer = BytesIO()
+    image.save(buffer, file_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(file):
+    """Write every size/format of `file` to its storage.
+
+    Returns the mapping stored in the model's variants field.
+    """
+    with file.open('rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+
+    files = {}
+    for variant, size in settings.IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        files[variant] = {}
+        for extension, (file_format, options) in FORMATS.items():
+            path = variant_path(file.name, variant, extension)
+            if file.storage.exists(path):
+                file.storage.delete(path)
+            files[variant][extension] = file.storage.save(
+                path, ContentFile(encode(image, file_format, options))
+            )
+    return {'source': file.name, 'files': files}
+
+
+def delete_variants(storage, variants):
+    for paths in variants.get('files', {}).values():
+        for path in paths.values():
+            storage.delete(path)
+
+
+def is_current(file, variants):
+    if not file:
+        return not variants
+    return variants.get('source') == file.name
+
+
+def process(model, pk, image_field, variants_field):
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    file = getattr(instance, image_field)
+    old_variants = getattr(instance, variants_field)
+    if is_current(file, old_variants):
+        return
+    setattr(instance, variants_field, render_variants(file) if file else {})
+    instance.save(update_fields=[variants_field])
+    # Variants of a replaced or cleared file are not referenced any more.
+    delete_variants(file.storage, old_variants)
+
+
+def process_in_thread(*args):
+    try:
+        process(*args)
+    finally:
+        connections.close_all()
+
+
+def schedule(sender, instance, image_field, variants_field, **kwargs):
+    file = getattr(instance, image_field)
+    if is_current(file, getattr(instance, variants_field)):
+        return
+    args = (sender, instance.pk, image_field, variants_field)
+    if settings.IMAGE_PROCESSING_SYNC:
+        transaction.on_commit(partial(process, *args))
+    else:
+        transaction.on_commit(
+            partial(executor.submit, process_in_thread, *args)
+        )
+
+
+def discard(sender, instance, image_field, variants_field, **kwargs):
+    variants = getattr(instance, variants_field)
+    if variants:
+        storage = getattr(instance, image_field).storage
+        transaction.on_commit(partial(delete_variants, storage, variants))
+
+
+def register(model, image_field, variants_field):
+    """Keep the variants of `image_field` in step with the file.
+
+    They are generated whenever it changes and deleted along with the
+    object.
+    """
+    post_delete.connect(
+        partial(
+            discard, image_field=image_field, variants_field=variants_field
+        ),
+        sender=model,
+        weak=False,
+        dispatch_uid=f'image_variants_delete_{model._meta.label}',
+    )
+    post_save.connect(
+        partial(
+            schedule, image_field=image_field, variants_field=variants_field
+        ),
+        sender=model,
+        weak=False,
+        dispatch_uid=f'image_variants_{model._meta.label}_{image_field}',
+    )
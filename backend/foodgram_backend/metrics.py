@@ -0,0 +1,85 @@
+"""Prometheus metrics of the backend.
+
+With PROMETHEUS_MULTIPROC_DIR set, every gunicorn worker writes its
+samples to memory-mapped files in that directory and `/api/metrics`
+merges them, so any worker can answer a scrape. Without it the
+metrics are kept in process.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    # gunicorn.conf.py creates it on start, but uvicorn and management
+    # commands run without that hook.
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'HTTP requests by endpoint, method and status.',
+    ['endpoint', 'method', 'status'],
+)
+LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Time to produce a response, by endpoint.',
+    ['endpoint'],
+    buckets=(
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+    ),
+)
+QUERIES = Histogram(
+    'foodgram_http_request_db_queries',
+    'SQL queries per request, by endpoint.',
+    ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+CACHE_LOOKUPS = Counter(
+    'foodgram_cache_lookups_total',
+    'Cache lookups by cache and result (hit or miss).',
+    ['cache', 'result'],
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'foodgram_image_upload_bytes',
+    'Size of decoded image uploads, by field.',
+    ['field'],
+    buckets=tuple(2 ** power * 1024 for power in range(4, 13)),
+)
+
+
+def endpoint_name(view, action):
+    if view is None:
+        return 'unmatched'
+    return f'{view}.{action}' if action else view
+
+
+def observe_request(endpoint, method, status, duration, queries):
+    REQUESTS.labels(endpoint, method, status).inc()
+    LATENCY.labels(endpoint).observe(duration)
+    QUERIES.labels(endpoint).observe(queries)
+
+
+def cache_lookup(name, hit):
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+def image_uploaded(field, size):
+    IMAGE_UPLOAD_BYTES.labels(field).observe(size)
+
+
+def exposition():
+    """Return the metrics in the Prometheus text format."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
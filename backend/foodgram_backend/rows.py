@@ -0,0 +1,37 @@
+"""Single-statement inserts and deletes that report what they changed."""
+from django.db import connections, router
+
+
+def change_rows(model, owner, owner_id, field, values, add):
+    """Insert or delete the `model` rows of `owner_id` pointing at `values`.
+
+    `owner` and `field` name the two foreign keys of the row. One
+    INSERT ... ON CONFLICT DO NOTHING or DELETE statement with RETURNING,
+    so the returned set holds only the values whose rows this statement
+    actually changed; rows a concurrent request added or removed
+    meanwhile are left out. Signals are not sent.
+    """
+    if not values:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    owner_column = quote(model._meta.get_field(owner).column)
+    column = quote(model._meta.get_field(field).column)
+    if add:
+        sql = (
+            f'INSERT INTO {table} ({owner_column}, {column}) VALUES '
+            + ', '.join(['(%s, %s)'] * len(values))
+            + f' ON CONFLICT DO NOTHING RETURNING {column}'
+        )
+        params = [param for value in values for param in (owner_id, value)]
+    else:
+        sql = (
+            f'DELETE FROM {table} WHERE {owner_column} = %s '
+            f'AND {column} IN ({", ".join(["%s"] * len(values))}) '
+            f'RETURNING {column}'
+        )
+        params = [owner_id, *values]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram_backend.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,16 +61,84 @@ WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 
 AUTH_USER_MODEL = 'profiles.User'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+USE_SQLITE = os.getenv('USE_SQLITE', default='False').lower() == 'true'
+
+if USE_SQLITE:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432)
+        }
+    }
+
+# Persistent connections: seconds to keep a connection open (0 closes it
+# after every request, None keeps it forever).
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '0')
+DATABASES['default']['CONN_MAX_AGE'] = (
+    None if DB_CONN_MAX_AGE == 'None' else int(DB_CONN_MAX_AGE)
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', default='True'
+).lower() == 'true'
+
+# Read replicas: PostgreSQL hosts, or SQLite file names as stand-ins.
+DATABASE_REPLICAS = []
+for number, location in enumerate(
+    os.getenv('DB_REPLICAS', '').split(), start=1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    if USE_SQLITE:
+        DATABASES[alias]['NAME'] = BASE_DIR / location
+    else:
+        DATABASES[alias]['HOST'] = location
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram_backend.db_router.ReplicaRouter']
+# How long a user's reads stay on the primary after they write.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# LocMem is per process, so other workers never see its writes. Without
+# a shared cache, version keys expire after VERSION_KEY_TIMEOUT seconds
+# and each worker picks up other workers' changes within that time.
+SHARED_CACHE = bool(REDIS_URL)
+VERSION_KEY_TIMEOUT = None if SHARED_CACHE else 5
+
+# Cached responses are invalidated through the version keys, so caching
+# is on by default only when every worker sees the same cache.
+RESPONSE_CACHE = os.getenv(
+    'RESPONSE_CACHE', default=str(SHARED_CACHE)
+).lower() == 'true'
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -101,12 +170,84 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+SHORT_LINK_FORMAT = os.getenv('SHORT_LINK_FORMAT', 'hex')
+SHORT_LINK_INDEX_TTL = int(os.getenv('SHORT_LINK_INDEX_TTL', 300))
+SHORT_LINK_LRU_SIZE = 10000
+SHORT_LINK_MAX_BITMAP_ID = 64 * 1024 * 1024
+
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_PROCESSING_SYNC = os.getenv(
+    'IMAGE_PROCESSING_SYNC', default='False'
+).lower() == 'true'
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_LIMIT', 20)
+)
+INGREDIENT_INDEX_IN_MEMORY = os.getenv(
+    'INGREDIENT_INDEX_IN_MEMORY', default='True'
+).lower() == 'true'
+
+# "What can I cook": change log replay window and result cap.
+MATCH_INDEX_MAX_REPLAY = 1000
+MATCH_INDEX_CHANGE_TTL = 24 * 60 * 60
+# Without a shared cache the sequence expires instead, and each worker
+# fully reloads the index to pick up other workers' changes.
+MATCH_INDEX_SEQUENCE_TIMEOUT = None if SHARED_CACHE else 60
+MATCH_RESULTS_LIMIT = int(os.getenv('MATCH_RESULTS_LIMIT', 1000))
+
+# Largest id list accepted by the bulk favorite/cart/subscribe endpoints.
+BULK_MAX_IDS = 100
+
+# Token -> user snapshots: shared cache TTL and the per-worker LRU.
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_LOCAL_TTL = 5
+AUTH_TOKEN_LRU_SIZE = 10000
+AUTH_TOKEN_REVOKED_TTL = 30
+
+# Server-Timing headers (db, serialize, render) and the slow-request log.
+SERVER_TIMING = os.getenv('SERVER_TIMING', default='False').lower() == 'true'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', 0.1))
+SLOW_REQUEST_TOP_QUERIES = 5
+
+# Prometheus metrics at /api/metrics; see foodgram_backend/metrics.py.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.slow_requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Route hot GET endpoints to the async views; meant for ASGI servers.
+ASYNC_READ_VIEWS = os.getenv(
+    'ASYNC_READ_VIEWS', default='False'
+).lower() == 'true'
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
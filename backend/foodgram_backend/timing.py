@@ -0,0 +1,219 @@
+import heapq
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger('foodgram.slow_requests')
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """SQL, serializer and render time of one request.
+
+    Every query adds to the count and DB time, and with `keep_queries`
+    the slowest ones are kept in a bounded heap for the slow-request log.
+    """
+
+    def __init__(self, keep_queries=0):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.keep_queries = keep_queries
+        self.slowest = []
+
+    def record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.keep_queries:
+                entry = (elapsed, self.queries, sql)
+                if len(self.slowest) < self.keep_queries:
+                    heapq.heappush(self.slowest, entry)
+                elif elapsed > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, entry)
+
+    def header(self, total):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+    def log_line(self, request, response, total):
+        view, action = view_name(request)
+        return json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': view,
+            'action': action,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'queries': self.queries,
+            'serialize_ms': round(self.serialize_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'slowest_queries': [
+                {'ms': round(elapsed * 1000, 1), 'sql': sql}
+                for elapsed, _, sql in sorted(self.slowest, reverse=True)
+            ],
+        }, ensure_ascii=False)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper that reports queries to the current request."""
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.record(execute, sql, params, many, context)
+
+
+def install_wrapper(connection, **kwargs):
+    # Connections are per thread and sync_to_async runs queries of async
+    # views in other threads, so the wrapper stays installed and finds
+    # the request through the context variable instead.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_name(request):
+    """Return the name of the view that served the request and its action."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.func.__name__, None
+    actions = getattr(match.func, 'actions', None) or {}
+    return view_class.__name__, actions.get(request.method.lower())
+
+
+class ServerTimingMiddleware:
+    """Per-request timings as Server-Timing headers, metrics and a log.
+
+    SERVER_TIMING adds the header to every response, METRICS_ENABLED
+    feeds the Prometheus request histograms. Requests slower than
+    SLOW_REQUEST_MS are logged, a SLOW_REQUEST_SAMPLE_RATE share of them,
+    with the SLOW_REQUEST_TOP_QUERIES slowest SQL statements. The only
+    per-query cost is one `perf_counter` pair in an execute wrapper.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not (
+            settings.SERVER_TIMING
+            or settings.SLOW_REQUEST_MS
+            or settings.METRICS_ENABLED
+        ):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(install_wrapper)
+        for connection in connections.all(initialized_only=True):
+            install_wrapper(connection)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings)
+
+    def start(self):
+        timings = RequestTimings(
+            settings.SLOW_REQUEST_TOP_QUERIES if settings.SLOW_REQUEST_MS
+            else 0
+        )
+        return timings, current_timings.set(timings)
+
+    def process_template_response(self, request, response):
+        timings = current_timings.get()
+        if timings is None:
+            return response
+        started = time.perf_counter()
+
+        def rendered(response):
+            timings.render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timings.header(total)
+        if (
+            settings.SLOW_REQUEST_MS
+            and total * 1000 >= settings.SLOW_REQUEST_MS
+            and random.random() < settings.SLOW_REQUEST_SAMPLE_RATE
+        ):
+            logger.warning(timings.log_line(request, response, total))
+        if settings.METRICS_ENABLED:
+            metrics.observe_request(
+                metrics.endpoint_name(*view_name(request)),
+                request.method,
+                response.status_code,
+                total,
+                timings.queries,
+            )
+        return response
+
+
+class ServerTimingMixin:
+    """Time the top-level serializer of a DRF view.
+
+    DB time spent while serializing (lazy relations) is left out, so the
+    db, serialize and render entries of the header add up.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        timings = current_timings.get()
+        if timings is None:
+            return serializer
+        to_representation = serializer.to_representation
+
+        def timed(instance):
+            started, db_time = time.perf_counter(), timings.db_time
+            try:
+                return to_representation(instance)
+            finally:
+                timings.serialize_time += (
+                    time.perf_counter() - started
+                    - (timings.db_time - db_time)
+                )
+
+        serializer.to_representation = timed
+        return serializer
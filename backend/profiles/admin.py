@@ -28,6 +28,18 @@ class UserAdmin(BaseUserAdmin):
         'email',
     )
 
+    def save_model(self, request, obj, form, change):
+        # The counters are not in the form; a full save would overwrite
+        # the F() updates made since the page was loaded. Many-to-many
+        # fields are saved by save_related.
+        if change:
+            concrete = {field.name for field in obj._meta.concrete_fields}
+            obj.save(update_fields=[
+                name for name in form.changed_data if name in concrete
+            ])
+        else:
+            super().save_model(request, obj, form, change)
+
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
@@ -27,6 +27,22 @@ class User(AbstractUser):
         null=True,
         verbose_name='Аватар',
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Размеры аватара',
+    )
+    recipe_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    follower_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
 
     class Meta:
         verbose_name = "Пользователь"
@@ -1,11 +1,15 @@
 from rest_framework import serializers
 from .models import User, Follow
-from foodgram_backend.image_field import Base64ImageField
+from foodgram_backend.image_field import (
+    Base64ImageField,
+    ImageVariantsField,
+)
 
 
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
+    avatar_variants = ImageVariantsField('avatar', 'avatar_variants')
 
     class Meta:
         model = User
@@ -17,12 +21,16 @@ class UserSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
         )
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
+        subscribed_ids = self.context.get('subscribed_ids')
+        if subscribed_ids is not None:
+            return obj.id in subscribed_ids
         return Follow.objects.filter(user=request.user, following=obj).exists()
 
 
@@ -59,6 +67,11 @@ class AvatarUploadSerializer(serializers.ModelSerializer):
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        instance.avatar = validated_data['avatar']
+        instance.save(update_fields=['avatar'])
+        return instance
+
 
 class SetPasswordSerializer(serializers.Serializer):
     current_password = serializers.CharField(write_only=True)
@@ -0,0 +1,5 @@
+from foodgram_backend import images
+
+from .models import User
+
+images.register(User, 'avatar', 'avatar_variants')
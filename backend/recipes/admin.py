@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Count
 
 from .models import (
     Product,
@@ -31,7 +30,7 @@ class DishAdmin(admin.ModelAdmin):
     list_display = (
         'title',
         'creator',
-        'bookmarked_total',
+        'bookmark_count',
     )
     search_fields = (
         'title',
@@ -40,13 +39,17 @@ class DishAdmin(admin.ModelAdmin):
     )
     inlines = [ComponentInline]
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(bookmark_count=Count('bookmarked_by'))
-
-    @admin.display(description='В избранном раз')
-    def bookmarked_total(self, obj):
-        return obj.bookmark_count
+    def save_model(self, request, obj, form, change):
+        # The counters are not in the form; a full save would overwrite
+        # the F() updates made since the page was loaded. Many-to-many
+        # fields are saved by save_related.
+        if change:
+            concrete = {field.name for field in obj._meta.concrete_fields}
+            obj.save(update_fields=[
+                name for name in form.changed_data if name in concrete
+            ])
+        else:
+            super().save_model(request, obj, form, change)
 
 
 @admin.register(Bookmark)
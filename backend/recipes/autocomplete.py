@@ -0,0 +1,78 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product
+
+VERSION_KEY = 'product_index_version'
+
+
+class ProductIndex:
+    """Sorted in-memory copy of the Product catalog for autocomplete.
+
+    The catalog is loaded once per worker and reloaded lazily when the
+    version key in the cache changes. Without a shared cache the key
+    expires after VERSION_KEY_TIMEOUT, which also reloads the catalog,
+    so edits made through other workers show up within that time.
+    """
+
+    def __init__(self):
+        self.entries = ([], [])
+        self.version = None
+        self.lock = Lock()
+
+    def load(self, version):
+        products = sorted(
+            (
+                Product(id=pk, title=title, unit=unit)
+                for pk, title, unit in Product.objects.values_list(
+                    'id', 'title', 'unit'
+                )
+            ),
+            key=lambda product: (product.title.casefold(), product.id),
+        )
+        self.entries = (
+            [product.title.casefold() for product in products],
+            products,
+        )
+        self.version = version
+
+    def ensure_loaded(self):
+        version = cache.get_or_set(
+            VERSION_KEY, time.time_ns, settings.VERSION_KEY_TIMEOUT
+        )
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.load(version)
+
+    def search(self, query, limit):
+        self.ensure_loaded()
+        query = query.casefold()
+        keys, products = self.entries
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit:
+            if not keys[end].startswith(query):
+                break
+            end += 1
+        result = products[start:end]
+        if len(result) < limit:
+            for key, product in zip(keys, products):
+                if query in key and not key.startswith(query):
+                    result.append(product)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+def invalidate():
+    # A timestamp rather than a counter, so a key that expired and was
+    # re-created never repeats a version of an earlier ETag.
+    cache.set(VERSION_KEY, time.time_ns(), settings.VERSION_KEY_TIMEOUT)
+
+
+product_index = ProductIndex()
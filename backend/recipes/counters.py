@@ -0,0 +1,48 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def count_of(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects
+            .filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount(apps=global_apps):
+    """Recalculate every denormalized counter with one UPDATE per table."""
+    Dish = apps.get_model('recipes', 'Dish')
+    Bookmark = apps.get_model('recipes', 'Bookmark')
+    Basket = apps.get_model('recipes', 'Basket')
+    User = apps.get_model('profiles', 'User')
+    Follow = apps.get_model('profiles', 'Follow')
+
+    dishes = Dish.objects.update(
+        bookmark_count=count_of(Bookmark, 'dish'),
+        basket_count=count_of(Basket, 'dish'),
+    )
+    users = User.objects.update(
+        recipe_count=count_of(Dish, 'creator'),
+        follower_count=count_of(Follow, 'following'),
+    )
+    return dishes, users
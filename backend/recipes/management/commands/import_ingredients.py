@@ -1,28 +1,184 @@
-import os
+import csv
 import json
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.autocomplete import invalidate
+from recipes.models import Product
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0].strip(), row[1].strip()
+
+
+def read_json(file):
+    """Yield the objects of a top-level JSON array without loading it."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise ValueError('Ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'].strip(), item['measurement_unit'].strip()
+        if not chunk:
+            if buffer[position:].strip():
+                raise ValueError('Незавершённый JSON-массив')
+            return
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class RowStream:
+    """File-like object feeding rows to COPY as CSV."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+
+    def read(self, size=-1):
+        output = []
+        length = len(self.buffer)
+        output.append(self.buffer)
+        for title, unit in self.rows:
+            line = '"{}","{}"\n'.format(
+                title.replace('"', '""'), unit.replace('"', '""')
+            )
+            output.append(line)
+            length += len(line)
+            if 0 < size <= length:
+                break
+        data = ''.join(output)
+        if size > 0:
+            data, self.buffer = data[:size], data[size:]
+        else:
+            self.buffer = ''
+        return data
 
 
 class Command(BaseCommand):
-    help = 'Импортирует данные из JSON файла в модель Ingredient'
+    help = 'Импортирует ингредиенты из CSV и JSON файлов в модель Product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=[str(settings.BASE_DIR / 'data')],
+            help='Файлы или папки с файлами .csv/.json',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузка через COPY (только PostgreSQL)',
+        )
+
+    def collect_files(self, paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for filename in sorted(os.listdir(path)):
+                    if os.path.splitext(filename)[1] in READERS:
+                        yield os.path.join(path, filename)
+            elif os.path.splitext(path)[1] in READERS:
+                yield path
+            else:
+                raise CommandError(f'Неподдерживаемый файл: {path}')
+
+    def insert_batches(self, rows, batch_size):
+        total = 0
+        for batch in batched(rows, batch_size):
+            Product.objects.bulk_create(
+                [Product(title=title, unit=unit) for title, unit in batch],
+                ignore_conflicts=True,
+            )
+            total += len(batch)
+        return total
 
-    def handle(self, *args, **kwargs):
-        data_folder = '/app/data'
+    def copy_rows(self, rows):
+        if connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только в PostgreSQL')
+        counted = []
 
-        for filename in os.listdir(data_folder):
-            if filename.endswith('.json'):
-                file_path = os.path.join(data_folder, filename)
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    data = json.load(file)
+        def counting(rows):
+            for row in rows:
+                counted.append(None)
+                yield row
 
-                    for item in data:
-                        name = item['name']
-                        measurement_unit = item['measurement_unit']
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE product_import '
+                '(title varchar(100), unit varchar(10)) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY product_import (title, unit) FROM STDIN '
+                'WITH (FORMAT csv)',
+                RowStream(counting(rows)),
+            )
+            cursor.execute(
+                'INSERT INTO recipes_product (title, unit) '
+                'SELECT DISTINCT title, unit FROM product_import '
+                'ON CONFLICT (title, unit) DO NOTHING'
+            )
+        return len(counted)
 
-                        Ingredient.objects.create(
-                            name=name,
-                            measurement_unit=measurement_unit)
+    def handle(self, *args, **options):
+        before = Product.objects.count()
+        started = time.perf_counter()
+        processed = 0
+        for file_path in self.collect_files(options['paths']):
+            reader = READERS[os.path.splitext(file_path)[1]]
+            with open(file_path, 'r', encoding='utf-8') as file:
+                rows = reader(file)
+                with transaction.atomic():
+                    if options['copy']:
+                        count = self.copy_rows(rows)
+                    else:
+                        count = self.insert_batches(
+                            rows, options['batch_size']
+                        )
+            processed += count
+            self.stdout.write(self.style.SUCCESS(
+                f'Импорт данных из файла {file_path} завершен: {count} строк'))
 
-                self.stdout.write(self.style.SUCCESS(
-                    f'Импорт данных из файла {filename} завершен'))
+        elapsed = time.perf_counter() - started
+        created = Product.objects.count() - before
+        invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} строк, добавлено {created}, '
+            f'{processed / max(elapsed, 1e-9):.0f} строк/с'))
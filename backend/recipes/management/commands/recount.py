@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, покупок, рецептов и подписчиков'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            dishes, users = recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано блюд: {dishes}, пользователей: {users}'))
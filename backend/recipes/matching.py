@@ -0,0 +1,191 @@
+import time
+from collections import defaultdict
+from functools import partial
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Component
+
+SEQUENCE_KEY = 'match_index_sequence'
+DISH_ID_TYPE = np.uint32
+
+
+def change_key(number):
+    return f'match_index_change:{number}'
+
+
+def clock():
+    return time.time_ns() // 1000
+
+
+def as_array(dish_ids):
+    return np.array(sorted(dish_ids), dtype=DISH_ID_TYPE)
+
+
+class IngredientMatchIndex:
+    """Inverted index from products to the dishes that use them.
+
+    Each product maps to a sorted array of dish ids, and `sizes[dish_id]`
+    is the number of components of the dish. Writes append the dish id
+    to a change log in the shared cache; every worker replays the log
+    and only re-reads the changed dishes, falling back to a full load
+    when the log has gaps.
+
+    Postings and sizes are replaced together as one `state` tuple and
+    never changed in place, so `match` always reads one generation
+    while another thread applies changes.
+    """
+
+    def __init__(self):
+        self.state = ({}, np.zeros(0, dtype=np.uint16))
+        self.dish_products = {}
+        self.sequence = None
+        self.lock = Lock()
+
+    def load(self, sequence):
+        postings = defaultdict(list)
+        dish_products = defaultdict(list)
+        rows = Component.objects.order_by().values_list(
+            'dish_id', 'product_id'
+        )
+        for dish_id, product_id in rows.iterator(chunk_size=10000):
+            postings[product_id].append(dish_id)
+            dish_products[dish_id].append(product_id)
+        dish_products = {
+            dish_id: tuple(products)
+            for dish_id, products in dish_products.items()
+        }
+        sizes = np.zeros(max(dish_products, default=0) + 1, dtype=np.uint16)
+        for dish_id, products in dish_products.items():
+            sizes[dish_id] = len(products)
+        self.dish_products = dish_products
+        self.state = (
+            {
+                product_id: as_array(dish_ids)
+                for product_id, dish_ids in postings.items()
+            },
+            sizes,
+        )
+        self.sequence = sequence
+
+    def apply(self, dish_ids, sequence):
+        rows = Component.objects.filter(dish_id__in=dish_ids).values_list(
+            'dish_id', 'product_id'
+        )
+        current = defaultdict(list)
+        for dish_id, product_id in rows:
+            current[dish_id].append(product_id)
+        postings, sizes = self.state
+        postings = dict(postings)
+        sizes = np.concatenate([
+            sizes,
+            np.zeros(max(max(dish_ids) + 1 - len(sizes), 0), np.uint16),
+        ])
+        for dish_id in dish_ids:
+            old = set(self.dish_products.pop(dish_id, ()))
+            new = set(current.get(dish_id, ()))
+            for product_id in old - new:
+                posting = postings[product_id]
+                posting = posting[posting != dish_id]
+                if len(posting):
+                    postings[product_id] = posting
+                else:
+                    del postings[product_id]
+            for product_id in new - old:
+                posting = postings.get(product_id)
+                postings[product_id] = (
+                    as_array([dish_id]) if posting is None
+                    else np.union1d(posting, as_array([dish_id]))
+                )
+            if new:
+                self.dish_products[dish_id] = tuple(new)
+            sizes[dish_id] = len(new)
+        self.state = (postings, sizes)
+        self.sequence = sequence
+
+    def ensure_current(self):
+        sequence = cache.get_or_set(
+            SEQUENCE_KEY, clock, settings.MATCH_INDEX_SEQUENCE_TIMEOUT
+        )
+        if sequence == self.sequence:
+            return
+        with self.lock:
+            if sequence == self.sequence:
+                return
+            behind = (
+                sequence - self.sequence if self.sequence is not None else -1
+            )
+            if not 0 < behind <= settings.MATCH_INDEX_MAX_REPLAY:
+                self.load(sequence)
+                return
+            changes = cache.get_many([
+                change_key(number)
+                for number in range(self.sequence + 1, sequence + 1)
+            ])
+            if len(changes) < behind:
+                self.load(sequence)
+            else:
+                self.apply(set(changes.values()), sequence)
+
+    def match(self, product_ids, max_missing=None, limit=None):
+        """Return dish ids ranked by the share of components covered.
+
+        Ties are broken by the number of covered components, then by
+        the newest dish.
+        """
+        self.ensure_current()
+        postings, sizes = self.state
+        lists = [postings[pk] for pk in set(product_ids) if pk in postings]
+        if not lists:
+            return []
+        covered = np.bincount(np.concatenate(lists), minlength=len(sizes))
+        dish_ids = np.flatnonzero(covered)
+        covered = covered[dish_ids]
+        total = sizes[dish_ids].astype(np.int64)
+        if max_missing is not None:
+            keep = total - covered <= max_missing
+            dish_ids, covered, total = (
+                dish_ids[keep], covered[keep], total[keep]
+            )
+        order = np.lexsort((-dish_ids, -covered, -covered / total))
+        return dish_ids[order[:limit]].tolist()
+
+
+match_index = IngredientMatchIndex()
+
+
+def dish_changed(dish_id):
+    """Record that the components of a dish changed, once committed.
+
+    A worker replaying the entry before the commit would re-read the old
+    components and never see the dish logged again.
+    """
+    transaction.on_commit(partial(log_change, dish_id))
+
+
+def log_change(dish_id):
+    try:
+        number = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        # The sequence was evicted. Restarting from the clock keeps it
+        # ahead of every worker, so they see a gap and reload fully.
+        cache.add(
+            SEQUENCE_KEY, clock(), settings.MATCH_INDEX_SEQUENCE_TIMEOUT
+        )
+        number = cache.incr(SEQUENCE_KEY)
+    cache.set(
+        change_key(number), dish_id, settings.MATCH_INDEX_CHANGE_TTL
+    )
+
+
+def reset():
+    """Make every worker reload the index, after bulk changes."""
+    transaction.on_commit(restart_sequence)
+
+
+def restart_sequence():
+    cache.set(SEQUENCE_KEY, clock(), settings.MATCH_INDEX_SEQUENCE_TIMEOUT)
@@ -0,0 +1,86 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:47
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100, verbose_name='Ингредиент')),
+                ('unit', models.CharField(max_length=10, verbose_name='Мера')),
+            ],
+            options={
+                'verbose_name': 'Продукт',
+                'verbose_name_plural': 'Продукты',
+                'ordering': ['title'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Dish',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=256, verbose_name='Название блюда')),
+                ('picture', models.ImageField(upload_to='dishes/', verbose_name='Картинка')),
+                ('description', models.TextField(verbose_name='Инструкция')),
+                ('duration', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Время готовки (мин)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Добавлено')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='created_dishes', to=settings.AUTH_USER_MODEL, verbose_name='Создатель')),
+            ],
+            options={
+                'verbose_name': 'Блюдо',
+                'verbose_name_plural': 'Блюда',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Bookmark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookmarks', to=settings.AUTH_USER_MODEL, verbose_name='Аккаунт')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookmarked_by', to='recipes.dish', verbose_name='Блюдо')),
+            ],
+            options={
+                'verbose_name': 'Закладка',
+                'verbose_name_plural': 'Закладки',
+            },
+        ),
+        migrations.CreateModel(
+            name='Basket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='baskets', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='in_baskets', to='recipes.dish', verbose_name='Блюдо')),
+            ],
+            options={
+                'verbose_name': 'Список покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.CreateModel(
+            name='Component',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Объём')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='components', to='recipes.dish', verbose_name='Блюдо')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_in', to='recipes.product', verbose_name='Продукт')),
+            ],
+            options={
+                'verbose_name': 'Компонент блюда',
+                'verbose_name_plural': 'Компоненты блюд',
+                'unique_together': {('dish', 'product')},
+            },
+        ),
+    ]
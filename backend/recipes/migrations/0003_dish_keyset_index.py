@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_product_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dish',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Блюдо', 'verbose_name_plural': 'Блюда'},
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['-created_at', '-id'], name='recipes_dish_created_id_idx'),
+        ),
+    ]
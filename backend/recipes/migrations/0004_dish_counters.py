@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:54
+
+from django.db import migrations, models
+
+# (counted model, its foreign key, counted-on model, counter field)
+COUNTERS = (
+    ('recipes.Bookmark', 'dish', 'recipes.Dish', 'bookmark_count'),
+    ('recipes.Basket', 'dish', 'recipes.Dish', 'basket_count'),
+    ('recipes.Dish', 'creator', 'profiles.User', 'recipe_count'),
+    ('profiles.Follow', 'following', 'profiles.User', 'follower_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for counted, foreign_key, target, counter in COUNTERS:
+        counted = apps.get_model(counted)
+        target = apps.get_model(target)
+        counted_table = quote(counted._meta.db_table)
+        target_table = quote(target._meta.db_table)
+        column = quote(counted._meta.get_field(foreign_key).column)
+        schema_editor.execute(
+            f'UPDATE {target_table} SET {quote(counter)} = ('
+            f'SELECT COUNT(*) FROM {counted_table} '
+            f'WHERE {counted_table}.{column} = {target_table}.{quote("id")})'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0006_user_counters'),
+        ('recipes', '0003_dish_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='basket_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок раз'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном раз'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_dish_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='picture_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Размеры картинки'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:56
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_products(apps, schema_editor):
+    Product = apps.get_model('recipes', 'Product')
+    Component = apps.get_model('recipes', 'Component')
+    duplicates = (
+        Product.objects.values('title', 'unit')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for group in duplicates:
+        extra_ids = list(
+            Product.objects.filter(title=group['title'], unit=group['unit'])
+            .exclude(id=group['keep_id'])
+            .values_list('id', flat=True)
+        )
+        dishes_with_kept = Component.objects.filter(
+            product_id=group['keep_id']
+        ).values('dish_id')
+        Component.objects.filter(
+            product_id__in=extra_ids, dish_id__in=dishes_with_kept
+        ).delete()
+        for extra_id in extra_ids:
+            Component.objects.filter(product_id=extra_id).exclude(
+                dish_id__in=Component.objects.filter(
+                    product_id=group['keep_id']
+                ).values('dish_id')
+            ).update(product_id=group['keep_id'])
+        Product.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_dish_picture_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_products, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('title', 'unit'), name='recipes_product_title_unit_uniq'),
+        ),
+    ]
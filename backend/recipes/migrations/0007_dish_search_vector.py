@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:09
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEX = 'recipes_dish_search_vector_gin'
+
+# The vector of recipes.search.search_vector as of this migration.
+FILL_VECTORS = """
+UPDATE recipes_dish SET search_vector =
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(product.title, ' ')
+        FROM recipes_component component
+        JOIN recipes_product product ON product.id = component.product_id
+        WHERE component.dish_id = recipes_dish.id
+    ), '')), 'C')
+"""
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} '
+        'ON recipes_dish USING gin (search_vector)'
+    )
+    schema_editor.execute(FILL_VECTORS)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_product_title_unit_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
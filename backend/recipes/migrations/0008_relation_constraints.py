@@ -0,0 +1,126 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+DISH_INDEX = models.Index(
+    fields=['creator', '-created_at', '-id'],
+    name='recipes_dish_creator_idx',
+)
+RELATION_CONSTRAINTS = {
+    'bookmark': models.UniqueConstraint(
+        fields=('user', 'dish'), name='recipes_bookmark_user_dish_uniq'
+    ),
+    'basket': models.UniqueConstraint(
+        fields=('user', 'dish'), name='recipes_basket_user_dish_uniq'
+    ),
+}
+COUNTERS = {'bookmark': 'bookmark_count', 'basket': 'basket_count'}
+
+
+def remove_duplicates(apps, schema_editor):
+    Dish = apps.get_model('recipes', 'Dish')
+    for model_name, counter in COUNTERS.items():
+        model = apps.get_model('recipes', model_name)
+        duplicates = (
+            model.objects.values('user', 'dish')
+            .annotate(keep_id=Min('id'), total=Count('id'))
+            .filter(total__gt=1)
+        )
+        dish_ids = set()
+        for group in duplicates:
+            model.objects.filter(
+                user=group['user'], dish=group['dish']
+            ).exclude(id=group['keep_id']).delete()
+            dish_ids.add(group['dish'])
+        if not dish_ids:
+            continue
+        quote = schema_editor.quote_name
+        dishes = quote(Dish._meta.db_table)
+        relations = quote(model._meta.db_table)
+        dish_column = quote(model._meta.get_field('dish').column)
+        schema_editor.execute(
+            f'UPDATE {dishes} SET {quote(counter)} = ('
+            f'SELECT COUNT(*) FROM {relations} '
+            f'WHERE {relations}.{dish_column} = {dishes}.{quote("id")}'
+            f') WHERE {quote("id")} IN ({", ".join(["%s"] * len(dish_ids))})',
+            sorted(dish_ids),
+        )
+
+
+def create_indexes(apps, schema_editor):
+    # The migration is not atomic, so on PostgreSQL the indexes are built
+    # CONCURRENTLY and writes to the tables are not blocked meanwhile.
+    postgres = schema_editor.connection.vendor == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgres else ''
+    Dish = apps.get_model('recipes', 'Dish')
+    schema_editor.add_index(Dish, DISH_INDEX, **(
+        {'concurrently': True} if postgres else {}
+    ))
+    for model_name, constraint in RELATION_CONSTRAINTS.items():
+        model = apps.get_model('recipes', model_name)
+        table = model._meta.db_table
+        columns = ', '.join(
+            model._meta.get_field(field).column
+            for field in constraint.fields
+        )
+        # A failed concurrent build leaves an INVALID index behind, e.g.
+        # when a duplicate is inserted after remove_duplicates ran.
+        schema_editor.execute(
+            f'DROP INDEX {concurrently}IF EXISTS {constraint.name}'
+        )
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX {concurrently}{constraint.name} '
+            f'ON {table} ({columns})'
+        )
+        if postgres:
+            schema_editor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {constraint.name} '
+                f'UNIQUE USING INDEX {constraint.name}'
+            )
+
+
+def drop_indexes(apps, schema_editor):
+    postgres = schema_editor.connection.vendor == 'postgresql'
+    for model_name, constraint in RELATION_CONSTRAINTS.items():
+        table = apps.get_model('recipes', model_name)._meta.db_table
+        schema_editor.execute(
+            f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint.name}'
+            if postgres else f'DROP INDEX IF EXISTS {constraint.name}'
+        )
+    schema_editor.execute(
+        f'DROP INDEX {"CONCURRENTLY " if postgres else ""}'
+        f'IF EXISTS {DISH_INDEX.name}'
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0007_dish_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicates, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name='dish', index=DISH_INDEX),
+                *(
+                    migrations.AddConstraint(
+                        model_name=model_name, constraint=constraint
+                    )
+                    for model_name, constraint
+                    in RELATION_CONSTRAINTS.items()
+                ),
+            ],
+        ),
+    ]
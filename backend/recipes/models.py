@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 from profiles.models import User
@@ -17,6 +18,12 @@ class Product(models.Model):
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
         ordering = ['title']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['title', 'unit'],
+                name='recipes_product_title_unit_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.unit})"
@@ -37,6 +44,12 @@ class Dish(models.Model):
         upload_to='dishes/',
         verbose_name='Картинка',
     )
+    picture_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Размеры картинки',
+    )
     description = models.TextField(
         verbose_name="Инструкция",
     )
@@ -48,11 +61,36 @@ class Dish(models.Model):
         auto_now_add=True,
         verbose_name="Добавлено"
     )
+    bookmark_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В избранном раз",
+    )
+    basket_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В списках покупок раз",
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name="Поисковый вектор",
+    )
 
     class Meta:
         verbose_name = "Блюдо"
         verbose_name_plural = "Блюда"
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='recipes_dish_created_id_idx',
+            ),
+            models.Index(
+                fields=['creator', '-created_at', '-id'],
+                name='recipes_dish_creator_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -99,6 +137,12 @@ class Bookmark(models.Model):
     class Meta:
         verbose_name = "Закладка"
         verbose_name_plural = "Закладки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'dish'],
+                name='recipes_bookmark_user_dish_uniq',
+            ),
+        ]
 
 
 class Basket(models.Model):
@@ -118,4 +162,10 @@ class Basket(models.Model):
     class Meta:
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'dish'],
+                name='recipes_basket_user_dish_uniq',
+            ),
+        ]
     
@@ -0,0 +1,98 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
+
+from .models import Component, Dish
+
+SEARCH_CONFIG = 'russian'
+# ts_rank's default weights for A (title), B (description), C (ingredients).
+TITLE_WEIGHT, DESCRIPTION_WEIGHT, INGREDIENT_WEIGHT = 1.0, 0.4, 0.2
+
+
+def search_vector():
+    """Weighted tsvector over the title, description and ingredient names."""
+    names = Subquery(
+        Component.objects.filter(dish=OuterRef('pk'))
+        .order_by()
+        .values('dish')
+        .annotate(names=StringAgg('product__title', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(names, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh(dish_ids):
+    """Recompute the stored search vector of the given dishes.
+
+    Only PostgreSQL stores vectors; other databases search with LIKE.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    Dish.objects.filter(pk__in=dish_ids).update(
+        search_vector=search_vector()
+    )
+
+
+def search(queryset, text):
+    """Filter dishes matching `text`, best matches first.
+
+    The rank is annotated as `search_rank` (a float), so it can be part
+    of a keyset cursor.
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query), FloatField()
+            )
+        ).order_by('-search_rank', '-id')
+    return fallback_search(queryset, text)
+
+
+def fallback_search(queryset, text):
+    """Substring search used where there is no tsvector (SQLite tests).
+
+    Every word has to occur in the title, description or an ingredient;
+    the rank adds the tsvector weight of the best field for each word.
+    """
+    rank = Value(0.0)
+    for word in text.split():
+        in_ingredients = Exists(Component.objects.filter(
+            dish=OuterRef('pk'), product__title__icontains=word
+        ))
+        queryset = queryset.filter(
+            Q(title__icontains=word)
+            | Q(description__icontains=word)
+            | in_ingredients
+        )
+        rank = rank + Case(
+            When(title__icontains=word, then=Value(TITLE_WEIGHT)),
+            When(description__icontains=word, then=Value(DESCRIPTION_WEIGHT)),
+            default=Value(INGREDIENT_WEIGHT),
+            output_field=FloatField(),
+        )
+    return queryset.annotate(
+        search_rank=Cast(rank, FloatField())
+    ).order_by('-search_rank', '-id')
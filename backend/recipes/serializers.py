@@ -1,6 +1,14 @@
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
-from foodgram_backend.image_field import Base64ImageField
+from foodgram_backend.image_field import (
+    Base64ImageField,
+    ImageVariantsField,
+)
+from foodgram_backend.rows import change_rows
 from profiles.models import User
+from . import search
+from .matching import dish_changed
 from .models import (
     Dish,
     Product,
@@ -30,10 +38,9 @@ class ComponentReadSerializer(serializers.ModelSerializer):
 
 
 class ComponentWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(),
-        source='product'
-    )
+    # Resolved to products for the whole list at once, see
+    # DishWriteSerializer.validate_ingredients.
+    id = serializers.IntegerField(min_value=1)
     quantity = serializers.IntegerField(min_value=1)
 
     class Meta:
@@ -46,11 +53,12 @@ class DishReadSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField()
     is_bookmarked = serializers.SerializerMethodField()
     is_in_basket = serializers.SerializerMethodField()
+    picture_variants = ImageVariantsField('picture', 'picture_variants')
 
     class Meta:
         model = Dish
         fields = (
-            'id', 'creator', 'title', 'picture',
+            'id', 'creator', 'title', 'picture', 'picture_variants',
             'description', 'duration', 'ingredients',
             'is_bookmarked', 'is_in_basket',
         )
@@ -60,8 +68,7 @@ class DishReadSerializer(serializers.ModelSerializer):
         return UserSerializer(obj.creator, context=self.context).data
 
     def get_ingredients(self, obj):
-        components = Component.objects.filter(dish=obj).select_related('product')
-        return ComponentReadSerializer(components, many=True).data
+        return ComponentReadSerializer(obj.components.all(), many=True).data
 
     def get_is_bookmarked(self, obj):
         return obj.id in self.context.get('bookmarked_ids', set())
@@ -84,10 +91,20 @@ class DishWriteSerializer(serializers.ModelSerializer):
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError("Нужен хотя бы один компонент.")
-        ids = [item['product'].id for item in value]
+        ids = [item['id'] for item in value]
         if len(ids) != len(set(ids)):
             raise serializers.ValidationError("Дублирующиеся ингредиенты.")
-        return value
+        products = Product.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in products]
+        if missing:
+            raise serializers.ValidationError(
+                "Несуществующие ингредиенты: "
+                f"{', '.join(map(str, missing))}."
+            )
+        return [
+            {'product': products[item['id']], 'quantity': item['quantity']}
+            for item in value
+        ]
 
     def create_components(self, dish, components_data):
         Component.objects.bulk_create([
@@ -97,6 +114,54 @@ class DishWriteSerializer(serializers.ModelSerializer):
                 quantity=item['quantity']
             ) for item in components_data
         ])
+        search.refresh([dish.id])
+        dish_changed(dish.id)
+
+    def update_components(self, dish, components_data):
+        """Apply only the difference with the stored components.
+
+        Changed quantities go in one bulk UPDATE, new products in one
+        INSERT and removed ones in one DELETE. The search vector and the
+        match index only depend on the products, so quantity changes
+        leave them alone.
+        """
+        current = {
+            component.product_id: component
+            for component in dish.components.all()
+        }
+        wanted = {
+            item['product'].id: item for item in components_data
+        }
+        changed = []
+        for product_id, item in wanted.items():
+            component = current.get(product_id)
+            if component and component.quantity != item['quantity']:
+                component.quantity = item['quantity']
+                changed.append(component)
+        added = [
+            Component(
+                dish=dish, product=item['product'], quantity=item['quantity']
+            )
+            for product_id, item in wanted.items()
+            if product_id not in current
+        ]
+        removed = current.keys() - wanted.keys()
+
+        if changed:
+            Component.objects.bulk_update(changed, ['quantity'])
+        if added:
+            Component.objects.bulk_create(added)
+        if removed:
+            # One DELETE, without the per-row post_delete receivers
+            # (search vector, match index, dish version) that
+            # QuerySet.delete() would run; the refresh below covers the
+            # whole dish once.
+            change_rows(
+                Component, 'dish', dish.id, 'product', removed, add=False
+            )
+        if added or removed:
+            search.refresh([dish.id])
+            dish_changed(dish.id)
 
     def create(self, validated_data):
         components = validated_data.pop('ingredients')
@@ -108,22 +173,31 @@ class DishWriteSerializer(serializers.ModelSerializer):
         components = validated_data.pop('ingredients', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        # Only the sent fields: a full save would write back the counters
+        # loaded with the instance over concurrent F() updates.
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
 
         if components is not None:
-            instance.components.all().delete()
-            self.create_components(instance, components)
+            self.update_components(instance, components)
 
         return instance
 
     def to_representation(self, instance):
+        # DRF drops the prefetched components after an update, and the
+        # new ones of a created dish were never fetched.
+        prefetch_related_objects([instance], Prefetch(
+            'components', queryset=Component.objects.select_related('product')
+        ))
         return DishReadSerializer(instance, context=self.context).data
 
 
 class DishShortSerializer(serializers.ModelSerializer):
+    picture_variants = ImageVariantsField('picture', 'picture_variants')
+
     class Meta:
         model = Dish
-        fields = ('id', 'title', 'picture', 'duration')
+        fields = ('id', 'title', 'picture', 'picture_variants', 'duration')
 
 
 class BookmarkSerializer(serializers.ModelSerializer):
@@ -154,15 +228,21 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and obj.follower.filter(user=user).exists()
+        return obj.id in self.context.get('subscribed_ids', set())
 
     def get_dishes(self, obj):
-        limit = self.context.get('recipes_limit')
-        queryset = Dish.objects.filter(creator=obj)
-        if limit and str(limit).isdigit():
-            queryset = queryset[:int(limit)]
-        return DishShortSerializer(queryset, many=True, context=self.context).data
+        dishes = self.context.get('author_dishes', {}).get(obj.id, [])
+        return DishShortSerializer(
+            dishes, many=True, context=self.context
+        ).data
 
     def get_total_dishes(self, obj):
-        return obj.created_dishes.count()
+        return obj.recipe_count
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS,
+    )
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from foodgram_backend import images
+from profiles.models import Follow, User
+
+from . import search
+from .autocomplete import invalidate
+from .counters import change_counter
+from .matching import dish_changed
+from .models import Basket, Bookmark, Component, Dish, Product
+
+SEARCH_FIELDS = {'title', 'description'}
+
+RELATION_COUNTERS = {
+    Bookmark: 'bookmark_count',
+    Basket: 'basket_count',
+}
+
+images.register(Dish, 'picture', 'picture_variants')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_index(sender, **kwargs):
+    # Workers reloading before the commit would cache the old catalog
+    # under the new version.
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Dish)
+def count_created_dish(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.creator_id, 'recipe_count', 1)
+
+
+@receiver(post_delete, sender=Dish)
+def count_deleted_dish(sender, instance, **kwargs):
+    change_counter(User, instance.creator_id, 'recipe_count', -1)
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_save, sender=Basket)
+def count_added_relation(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Dish, instance.dish_id, RELATION_COUNTERS[sender], 1
+        )
+
+
+@receiver(post_delete, sender=Bookmark)
+@receiver(post_delete, sender=Basket)
+def count_removed_relation(sender, instance, **kwargs):
+    change_counter(Dish, instance.dish_id, RELATION_COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.following_id, 'follower_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    change_counter(User, instance.following_id, 'follower_count', -1)
+
+
+@receiver(post_save, sender=Dish)
+def refresh_dish_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS & set(update_fields):
+        return
+    search.refresh([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Component)
+def refresh_component_search(sender, instance, **kwargs):
+    search.refresh([instance.dish_id])
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search(sender, instance, created, **kwargs):
+    if not created:
+        search.refresh(
+            Dish.objects.filter(components__product=instance).values('id')
+        )
+
+
+@receiver([post_save, post_delete], sender=Component)
+def update_match_index(sender, instance, **kwargs):
+    dish_changed(instance.dish_id)
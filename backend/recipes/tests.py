@@ -1 +1,608 @@
+import base64
+import re
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from profiles.models import Follow, User
+from rest_framework.test import APIClient
+
+from .autocomplete import ProductIndex, invalidate
+from .management.commands import import_ingredients
+from .matching import IngredientMatchIndex
+from .models import Bookmark, Component, Dish, Product
+
+
+class ProductIndexTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(title=title, unit='г') for title in (
+                'сахар', 'Сахарная пудра', 'сахарин', 'соль',
+                'тростниковый сахар', 'ванильный сахар',
+            )
+        ])
+
+    def setUp(self):
+        self.index = ProductIndex()
+
+    def titles(self, query, limit=10):
+        return [product.title for product in self.index.search(query, limit)]
+
+    def test_prefix_matches_rank_before_contains(self):
+        self.assertEqual(
+            self.titles('САХАР'),
+            [
+                'сахар', 'сахарин', 'Сахарная пудра',
+                'ванильный сахар', 'тростниковый сахар',
+            ],
+        )
+
+    def test_result_is_capped(self):
+        self.assertEqual(self.titles('сах', limit=2), ['сахар', 'сахарин'])
+
+    def test_index_is_rebuilt_on_product_change(self):
+        self.assertEqual(self.titles('соль'), ['соль'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='соль морская', unit='г')
+        self.assertEqual(self.titles('соль'), ['соль', 'соль морская'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(title='соль').get().delete()
+        self.assertEqual(self.titles('соль'), ['соль морская'])
+
+    def test_index_is_not_invalidated_before_commit(self):
+        self.assertEqual(self.titles('соль'), ['соль'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Product.objects.create(title='соль морская', unit='г')
+            # Reloading in this window must not pick up a new version.
+            self.assertEqual(self.titles('соль'), ['соль'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.titles('соль'), ['соль', 'соль морская'])
+
+    def test_search_does_not_hit_database_once_loaded(self):
+        self.titles('с')
+        with self.assertNumQueries(0):
+            self.titles('са')
+
+    @override_settings(SHARED_CACHE=False, VERSION_KEY_TIMEOUT=5)
+    def test_other_workers_changes_show_up_after_timeout(self):
+        self.assertEqual(self.titles('соль'), ['соль'])
+        # Written by another worker: no signal reaches this one's cache.
+        Product.objects.bulk_create([Product(title='соль морская', unit='г')])
+        self.assertEqual(self.titles('соль'), ['соль'])
+        later = time.time() + 6
+        with mock.patch(
+            'django.core.cache.backends.locmem.time.time', return_value=later
+        ):
+            self.assertEqual(self.titles('соль'), ['соль', 'соль морская'])
+
+
+class IngredientAutocompleteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(title=f'продукт {i}', unit='г') for i in range(30)
+        ] + [Product(title='мука', unit='г')])
+
+    def setUp(self):
+        invalidate()
+
+    def test_in_memory_and_database_paths_agree(self):
+        client = APIClient()
+        url = '/api/ingredients/?name=прод'
+        with override_settings(INGREDIENT_INDEX_IN_MEMORY=True):
+            in_memory = client.get(url).json()
+        with override_settings(INGREDIENT_INDEX_IN_MEMORY=False):
+            database = client.get(url).json()
+        self.assertEqual(len(in_memory), 20)
+        self.assertEqual(in_memory, database)
+
+
+class IngredientMatchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com',
+            username='cook',
+            first_name='Cook',
+            last_name='Cook',
+            password='password',
+        )
+        cls.products = {
+            title: Product.objects.create(title=title, unit='г')
+            for title in ('яйца', 'молоко', 'мука', 'сахар', 'соль')
+        }
+        cls.dishes = {
+            title: cls.create_dish(title, products)
+            for title, products in (
+                ('омлет', ['яйца', 'молоко', 'соль']),
+                ('блины', ['яйца', 'молоко', 'мука', 'сахар']),
+                ('яичница', ['яйца', 'соль']),
+                ('сахарный сироп', ['сахар']),
+            )
+        }
+
+    @classmethod
+    def create_dish(cls, title, products):
+        dish = Dish.objects.create(
+            creator=cls.user,
+            title=title,
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+        for product in products:
+            Component.objects.create(
+                dish=dish, product=cls.products[product], quantity=1
+            )
+        return dish
+
+    def setUp(self):
+        cache.clear()
+        self.index = IngredientMatchIndex()
+
+    def match(self, products, max_missing=None):
+        ids = self.index.match(
+            [self.products[title].id for title in products], max_missing
+        )
+        titles = {dish.id: title for title, dish in self.dishes.items()}
+        return [titles[dish_id] for dish_id in ids]
+
+    def test_dishes_are_ranked_by_coverage(self):
+        self.assertEqual(
+            self.match(['яйца', 'соль', 'молоко']),
+            ['омлет', 'яичница', 'блины'],
+        )
+
+    def test_max_missing(self):
+        self.assertEqual(
+            self.match(['яйца', 'молоко'], max_missing=1),
+            ['омлет', 'яичница'],
+        )
+
+    def test_component_writes_are_applied_incrementally(self):
+        self.match(['мука'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Component.objects.create(
+                dish=self.dishes['омлет'],
+                product=self.products['мука'],
+                quantity=1,
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.match(['мука']), ['блины', 'омлет'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dishes['блины'].components.all().delete()
+        self.assertEqual(self.match(['мука']), ['омлет'])
+
+    def test_changes_are_logged_after_commit(self):
+        self.match(['мука'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Component.objects.create(
+                dish=self.dishes['омлет'],
+                product=self.products['мука'],
+                quantity=1,
+            )
+            sequence = self.index.sequence
+            self.match(['мука'])
+            self.assertEqual(self.index.sequence, sequence)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.match(['мука']), ['блины', 'омлет'])
+
+    def test_applying_changes_keeps_the_previous_state_intact(self):
+        self.match(['мука'])
+        postings, sizes = self.index.state
+        before = {pk: posting.copy() for pk, posting in postings.items()}
+        with self.captureOnCommitCallbacks(execute=True):
+            Component.objects.create(
+                dish=self.dishes['омлет'],
+                product=self.products['мука'],
+                quantity=1,
+            )
+        self.match(['мука'])
+        self.assertIsNot(self.index.state[1], sizes)
+        self.assertEqual(sizes[self.dishes['омлет'].id], 3)
+        self.assertEqual(postings.keys(), before.keys())
+        for pk, posting in postings.items():
+            self.assertEqual(posting.tolist(), before[pk].tolist())
+
+    @override_settings(MATCH_INDEX_SEQUENCE_TIMEOUT=60)
+    def test_other_workers_changes_show_up_after_timeout(self):
+        self.assertEqual(self.match(['мука']), ['блины'])
+        # Written by another worker: no signal reaches this one's cache.
+        Component.objects.bulk_create([Component(
+            dish=self.dishes['омлет'],
+            product=self.products['мука'],
+            quantity=1,
+        )])
+        self.assertEqual(self.match(['мука']), ['блины'])
+        later = time.time() + 61
+        with mock.patch(
+            'django.core.cache.backends.locmem.time.time', return_value=later
+        ):
+            self.assertEqual(self.match(['мука']), ['блины', 'омлет'])
+
+    def test_api_filter(self):
+        have = ','.join(
+            str(self.products[title].id) for title in ('яйца', 'соль')
+        )
+        response = APIClient().get(
+            '/api/recipes/', {'have': have, 'max_missing': 1}
+        )
+        self.assertEqual(
+            [dish['title'] for dish in response.json()['results']],
+            ['яичница', 'омлет'],
+        )
+        response = APIClient().get('/api/recipes/', {'have': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+# Not about slow requests: keep their log line out of the test output.
+@override_settings(SLOW_REQUEST_MS=0)
+class CounterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = [
+            User.objects.create_user(
+                email=f'{name}@example.com',
+                username=name,
+                first_name=name,
+                last_name=name,
+                password='password',
+            ) for name in ('author', 'reader')
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.dish = Dish.objects.create(
+            creator=self.author,
+            title='dish',
+            picture='dishes/test.png',
+            description='description',
+            duration=10,
+        )
+
+    def assert_counts(self, **expected):
+        self.dish.refresh_from_db()
+        self.author.refresh_from_db()
+        actual = {
+            'recipe_count': self.author.recipe_count,
+            'follower_count': self.author.follower_count,
+            'bookmark_count': self.dish.bookmark_count,
+            'basket_count': self.dish.basket_count,
+        }
+        self.assertEqual(actual, expected)
+
+    def test_counters_follow_api_writes(self):
+        self.assert_counts(
+            recipe_count=1, follower_count=0,
+            bookmark_count=0, basket_count=0,
+        )
+        for action in ('favorite', 'shopping_cart'):
+            self.client.post(f'/api/recipes/{self.dish.id}/{action}/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assert_counts(
+            recipe_count=1, follower_count=1,
+            bookmark_count=1, basket_count=1,
+        )
+        self.client.delete(f'/api/recipes/{self.dish.id}/favorite/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assert_counts(
+            recipe_count=1, follower_count=0,
+            bookmark_count=0, basket_count=1,
+        )
+
+    def test_partial_writes_leave_counters_alone(self):
+        User.objects.filter(pk=self.author.pk).update(
+            avatar='avatars/old.png'
+        )
+        self.author.refresh_from_db()
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(
+                f'/api/recipes/{self.dish.id}/', {'title': 'renamed'},
+                format='json',
+            )
+            self.client.delete('/api/users/me/avatar/')
+            self.client.post('/api/users/set_password/', {
+                'current_password': 'password',
+                'new_password': 'another-password-1',
+            })
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 3)
+        for sql in updates:
+            self.assertNotIn('_count"', sql)
+        self.dish.refresh_from_db()
+        self.assertEqual(self.dish.title, 'renamed')
+
+    def test_recount_repairs_drift(self):
+        Bookmark.objects.create(user=self.reader, dish=self.dish)
+        Follow.objects.create(user=self.reader, following=self.author)
+        Dish.objects.filter(pk=self.dish.pk).update(
+            bookmark_count=7, basket_count=3
+        )
+        User.objects.filter(pk=self.author.pk).update(
+            recipe_count=0, follower_count=5
+        )
+        call_command('recount', stdout=StringIO())
+        self.assert_counts(
+            recipe_count=1, follower_count=1,
+            bookmark_count=1, basket_count=0,
+        )
+
+
+class ComponentUpdateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='editor@example.com',
+            username='editor',
+            first_name='Editor',
+            last_name='Editor',
+            password='password',
+        )
+        cls.products = Product.objects.bulk_create([
+            Product(title=title, unit='г')
+            for title in ('мука', 'яйцо', 'молоко', 'сахар')
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.dish = Dish.objects.create(
+            creator=self.user,
+            title='блины',
+            picture='dishes/test.png',
+            description='description',
+            duration=20,
+        )
+        Component.objects.bulk_create([
+            Component(dish=self.dish, product=product, quantity=100)
+            for product in self.products[:3]
+        ])
+
+    def patch(self, quantities):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.dish.id}/',
+                {
+                    'title': 'блинчики',
+                    'ingredients': [
+                        {'id': product.id, 'quantity': quantity}
+                        for product, quantity in quantities
+                    ],
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        writes = re.compile(
+            r'(INSERT INTO|UPDATE|DELETE FROM) "recipes_component"'
+        )
+        return [
+            match.group(1).split()[0]
+            for match in map(writes.match, (q['sql'] for q in queries))
+            if match
+        ]
+
+    def components(self):
+        return dict(self.dish.components.values_list('product_id', 'id'))
+
+    def test_unchanged_ingredients_are_not_rewritten(self):
+        before = self.components()
+        statements = self.patch(
+            [(product, 100) for product in self.products[:3]]
+        )
+        self.assertEqual(statements, [])
+        self.assertEqual(self.components(), before)
+        self.assertEqual(Dish.objects.get(id=self.dish.id).title, 'блинчики')
+
+    def test_only_the_difference_is_written(self):
+        flour, eggs, milk, sugar = self.products
+        before = self.components()
+        statements = self.patch([(flour, 100), (eggs, 3), (sugar, 20)])
+        self.assertEqual(sorted(statements), ['DELETE', 'INSERT', 'UPDATE'])
+        self.assertEqual(
+            dict(self.dish.components.values_list('product_id', 'quantity')),
+            {flour.id: 100, eggs.id: 3, sugar.id: 20},
+        )
+        after = self.components()
+        self.assertEqual(after[flour.id], before[flour.id])
+        self.assertEqual(after[eggs.id], before[eggs.id])
+        response = self.client.get('/api/recipes/', {'have': sugar.id})
+        self.assertEqual(
+            [dish['id'] for dish in response.json()['results']],
+            [self.dish.id],
+        )
+
+    def test_removal_is_one_delete(self):
+        flour = self.products[0]
+        with mock.patch('recipes.signals.dish_changed') as per_row, \
+                CaptureQueriesContext(connection) as queries:
+            statements = self.patch([(flour, 100)])
+        self.assertEqual(statements, ['DELETE'])
+        # No collector SELECT of the removed rows and no post_delete.
+        self.assertFalse(any(
+            '"recipes_component"."product_id" IN' in query['sql']
+            for query in queries
+            if query['sql'].startswith('SELECT')
+        ))
+        per_row.assert_not_called()
+        self.assertEqual(self.components().keys(), {flour.id})
+
+    def test_ingredients_are_resolved_in_one_query(self):
+        counts = []
+        for size in (1, 4):
+            with CaptureQueriesContext(connection) as queries:
+                self.patch([(product, 5) for product in self.products[:size]])
+            counts.append(sum(
+                'FROM "recipes_product"' in query['sql'] for query in queries
+            ))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unknown_ingredients_are_reported_together(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.dish.id}/',
+            {'ingredients': [
+                {'id': self.products[0].id, 'quantity': 1},
+                {'id': 999998, 'quantity': 1},
+                {'id': 999999, 'quantity': 1},
+            ]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['ingredients'],
+            ['Несуществующие ингредиенты: 999998, 999999.'],
+        )
+        self.assertEqual(self.dish.components.count(), 3)
+
+
+class ImageVariantsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root, IMAGE_PROCESSING_SYNC=True
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='painter@example.com',
+            username='painter',
+            first_name='Painter',
+            last_name='Painter',
+            password='password',
+        )
+        cls.product = Product.objects.create(title='краска', unit='г')
+
+    def encoded_image(self):
+        image = Image.new('RGB', (2000, 1000), 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        data = base64.b64encode(buffer.getvalue()).decode()
+        return f'data:image/jpeg;base64,{data}'
+
+    def test_variants_are_generated_on_upload(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/recipes/', {
+                'title': 'picture',
+                'picture': self.encoded_image(),
+                'description': 'description',
+                'duration': 5,
+                'ingredients': [{'id': self.product.id, 'quantity': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        dish = Dish.objects.get()
+        variants = dish.picture_variants
+        self.assertEqual(variants['source'], dish.picture.name)
+
+        for variant, size in settings.IMAGE_VARIANTS.items():
+            for extension in ('webp', 'jpeg'):
+                with dish.picture.storage.open(
+                    variants['files'][variant][extension]
+                ) as file:
+                    image = Image.open(file)
+                    self.assertEqual(image.format, extension.upper())
+                    self.assertEqual(max(image.size), size)
+                    self.assertNotIn(0x010F, image.getexif())
+
+        data = client.get(f'/api/recipes/{dish.id}/').json()
+        thumbnail = data['picture_variants']['thumbnail']['webp']
+        self.assertTrue(thumbnail.startswith('http://testserver/'))
+        self.assertTrue(thumbnail.endswith('_thumbnail.webp'))
+        with dish.picture.open() as file:
+            self.assertNotIn(0x010F, Image.open(file).getexif())
+
+    def variant_paths(self, variants):
+        return [
+            path for paths in variants['files'].values()
+            for path in paths.values()
+        ]
+
+    def test_old_variants_are_deleted(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = {'avatar': self.encoded_image()}
+        with self.captureOnCommitCallbacks(execute=True):
+            client.put('/api/users/me/avatar/', upload, format='json')
+        self.user.refresh_from_db()
+        storage = self.user.avatar.storage
+        first = self.variant_paths(self.user.avatar_variants)
+        self.assertTrue(all(storage.exists(path) for path in first))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.put('/api/users/me/avatar/', upload, format='json')
+        self.user.refresh_from_db()
+        second = self.variant_paths(self.user.avatar_variants)
+        self.assertFalse(any(storage.exists(path) for path in first))
+        self.assertTrue(all(storage.exists(path) for path in second))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete('/api/users/me/avatar/')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_variants, {})
+        self.assertFalse(any(storage.exists(path) for path in second))
+
+
+class ImportIngredientsTest(TestCase):
+
+    def run_import(self, *paths):
+        call_command('import_ingredients', *paths, stdout=StringIO())
+
+    def expected(self):
+        with open(settings.BASE_DIR / 'data' / 'ingredients.csv') as file:
+            return set(import_ingredients.read_csv(file))
+
+    def test_import_is_idempotent(self):
+        self.run_import()
+        self.run_import()
+        self.assertEqual(
+            set(Product.objects.values_list('title', 'unit')),
+            self.expected(),
+        )
+        self.assertEqual(Product.objects.count(), len(self.expected()))
+
+    def test_json_is_parsed_across_chunk_boundaries(self):
+        path = settings.BASE_DIR / 'data' / 'ingredients.json'
+        with mock.patch.object(import_ingredients, 'CHUNK_SIZE', 7):
+            with open(path, encoding='utf-8') as file:
+                rows = set(import_ingredients.read_json(file))
+        self.assertEqual(rows, self.expected())
+
+    def test_copy_requires_postgresql(self):
+        with self.assertRaises(CommandError):
+            call_command('import_ingredients', '--copy', stdout=StringIO())